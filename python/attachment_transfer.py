@@ -0,0 +1,142 @@
+# Downloads Discord attachments so they can be reuploaded, shared by Contore and Ermboard.
+# Downloads are streamed into spooled temporary files so big attachments don't sit in memory, then kept in
+# data/attachments/ for a little while so an attachment that gets quoted and ermboarded is only downloaded once.
+
+import asyncio
+import hashlib
+import os
+import time
+from discord import Attachment, File
+from httpx import AsyncClient, HTTPError, Limits, Timeout
+from shutil import copyfileobj
+from tempfile import SpooledTemporaryFile, mkstemp
+from urllib.parse import urlsplit
+
+CACHE_FOLDER = "data/attachments/"
+CACHE_TTL = 10 * 60 # seconds a downloaded attachment is reused for
+CACHE_MAX_BYTES = 512 * 1024 * 1024
+SPOOL_BYTES = 1024 * 1024 # downloads bigger than this spill over from memory to a temporary file
+CONNECTIONS = 8
+
+max_bytes = int(os.environ.get("ATTACHMENT_MAX_BYTES", 25 * 1024 * 1024)) # bigger attachments aren't copied
+
+# one long lived client, so connections to the cdn are kept alive and reused between messages
+client = AsyncClient(timeout=Timeout(30, pool=None), follow_redirects=True, limits=Limits(max_connections=CONNECTIONS, max_keepalive_connections=CONNECTIONS))
+downloads = {} # {cache path: task} for downloads in progress
+
+def attachment_entry(attachment: Attachment) -> list:
+    return [attachment.filename, attachment.url, attachment.is_spoiler(), attachment.description]
+
+def is_image(attachment: Attachment) -> bool:
+    return (attachment.content_type or "").startswith("image/")
+
+def cache_path(url: str) -> str:
+    # the query string of a cdn url is a signature that changes, the path is what identifies the attachment
+    return os.path.join(CACHE_FOLDER, hashlib.sha256(urlsplit(url).path.encode()).hexdigest())
+
+def is_cached(path: str) -> bool:
+    try:
+        return time.time() - os.path.getmtime(path) < CACHE_TTL
+    except OSError:
+        return False
+
+async def stream(url: str, limit: int):
+    # returns a SpooledTemporaryFile holding the attachment, or None if it failed or is bigger than limit
+    spool = SpooledTemporaryFile(max_size=SPOOL_BYTES)
+    try:
+        async with client.stream("GET", url) as response:
+            if response.status_code != 200 or int(response.headers.get("Content-Length", 0)) > limit:
+                spool.close()
+                return None
+            size = 0
+            async for chunk in response.aiter_bytes():
+                size += len(chunk)
+                if size > limit: # Content-Length can be missing or wrong
+                    spool.close()
+                    return None
+                spool.write(chunk)
+    except HTTPError as e:
+        print(f"Couldn't download attachment {url}: {e}")
+        spool.close()
+        return None
+    spool.seek(0)
+    return spool
+
+def store(spool: SpooledTemporaryFile, path: str):
+    # contore and ermboard share the folder, so every write gets its own temporary file
+    os.makedirs(CACHE_FOLDER, exist_ok=True)
+    fd, temp_path = mkstemp(dir=CACHE_FOLDER, suffix=".tmp")
+    try:
+        with spool, os.fdopen(fd, "wb") as f:
+            copyfileobj(spool, f)
+        os.replace(temp_path, path)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+    evict_cache()
+
+def evict_cache():
+    # expired attachments go first, then the oldest ones once the folder is over its size limit
+    now = time.time()
+    entries = []
+    for entry in os.scandir(CACHE_FOLDER):
+        try:
+            stat = entry.stat()
+        except OSError: # removed by the other bot
+            continue
+        if not entry.name.endswith(".tmp"):
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        elif now - stat.st_mtime > CACHE_TTL: # left behind by a crash
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+    total = sum(size for _, size, _ in entries)
+    for mtime, size, path in sorted(entries):
+        if total <= CACHE_MAX_BYTES and now - mtime < CACHE_TTL:
+            break
+        try:
+            os.remove(path)
+        except OSError: # still open somewhere (windows)
+            pass
+        total -= size
+
+async def fetch(url: str, path: str, limit: int):
+    spool = await stream(url, limit)
+    if spool is None:
+        return None
+    await asyncio.to_thread(store, spool, path)
+    return path
+
+async def download(url: str, limit: int = None):
+    # returns the path of the downloaded attachment, or None if it couldn't be downloaded
+    path = cache_path(url)
+    if is_cached(path):
+        return path
+    if path not in downloads: # share the download with anyone else waiting on the same attachment
+        task = asyncio.ensure_future(fetch(url, path, limit or max_bytes))
+        downloads[path] = task
+        task.add_done_callback(lambda _: downloads.pop(path, None))
+    return await asyncio.shield(downloads[path])
+
+async def download_files(attachments: list) -> list[File]:
+    # attachments are [filename, url, spoiler, description], they're all downloaded at once
+    # ones that are too big or couldn't be downloaded are left out
+    paths = await asyncio.gather(*(download(url) for _, url, _, _ in attachments), return_exceptions=True)
+    files = []
+    for (filename, url, spoiler, description), path in zip(attachments, paths):
+        if isinstance(path, Exception):
+            print(f"Couldn't download attachment {url}: {path}")
+        elif path:
+            try:
+                files.append(File(path, filename=filename, spoiler=spoiler, description=description))
+            except OSError: # evicted in the meantime
+                print(f"Attachment {filename} was evicted before it could be sent")
+    return files
+
+async def close():
+    # called when the bots shut down
+    await client.aclose()
@@ -9,6 +9,8 @@
 #  - silly family commands (marriage, adoption, view family tree)
 #  - and sending a customizable message in a given text channel when a user leaves the server.
 
+import time
+startup_started = time.perf_counter()
 from discord.utils import format_dt
 from discord.abc import GuildChannel, Snowflake
 from discord.ext import commands, tasks
@@ -17,21 +19,32 @@ from discord import Client, Intents, ButtonStyle, Interaction, User, Role, Objec
 from typing import Literal, Union
 from graphviz import Digraph
 import subprocess
-from datetime import datetime
-from httpx import AsyncClient
+from datetime import datetime, timedelta, timezone
+from httpx import AsyncClient, HTTPError
+import attachment_transfer
 from io import BytesIO
-from requests import get
 from html import escape
+from bisect import bisect_left, bisect_right, insort
+from collections import deque, OrderedDict
+from heapq import heappush, heappop
+from itertools import chain, count
 import asyncio
+import atexit
+import calendar
+import hashlib
 import random
 import psutil
 import json
+import sqlite3
+import tempfile
+import threading
 #import poe
 import sys
 import re
 import os
 os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
-from transformers import pipeline
+
+startup_times = {"imports": time.perf_counter() - startup_started} # {phase: seconds}, reported once contore is ready
 
 contore_config = {
   "owner_id": 1234567890123456789, # your user id
@@ -45,6 +58,7 @@ data = {
     "birthdays": {},
     # structure: {guild_id: (role_id, channel_id)}
     "birthday_data": {},
+    "birthdays_sent": {}, # {guild_id: {user_id: date celebrated}}
     "quotes": {},
     "families": {},
     "leave_msgs": {},
@@ -54,17 +68,25 @@ data = {
     "achievement_defs": {},
     # Structure: {guild_id: {user_id: {metric: value}}}
     "achievement_progress": {},
+    # structure: {segment: last progress journal segment included in the saved data}
+    "progress_journal": {},
+    # structure: {guild_id: {user_id: timestamp voice minutes were last credited up to}}
+    "voice_sessions": {},
 }
 
-voice_tracking = {} # {guild_id: {user_id: join_time}}
-
 intents = Intents.all()
 
-contore = Client(intents=intents)
+class Contore(Client):
+    async def close(self):
+        await super().close()
+        await attachment_transfer.close()
+        await avatar_client.aclose()
+
+contore = Contore(intents=intents)
 ctree = app_commands.CommandTree(contore)
-classifier = pipeline("sentiment-analysis", model="bhadresh-savani/bert-base-go-emotion", top_k=None)
+classifier = None # loaded on first use (or warmed after on_ready), transformers alone takes seconds to import
+classifier_lock = threading.Lock()
 tokenizer_kwargs = {"padding": True, "truncation": True, "max_length": 128}
-attachment_retriever = AsyncClient()
 perms = Permissions(manage_messages=True, manage_threads=True, manage_expressions=True, view_audit_log=True, manage_guild=True, manage_nicknames=True, kick_members=True, ban_members=True, create_expressions=True, moderate_members=True, create_events=True, manage_events=True)
 
 WHITELISTED_ADMIN_SERVERS = [
@@ -102,12 +124,6 @@ if not os.path.exists("data"):
     # create the directory if it doesn't exist
     os.makedirs("data")
 
-if not os.path.isfile("data/data.cont"):
-    # Save dictionary as JSON
-    open("data/data.cont", "w").close()
-    with open("data/data.cont", "w") as f:
-        json.dump(data, f)
-
 def encode_sets(obj):
     if isinstance(obj, set):
         return {"__set__": list(obj)}  # Mark sets with a special key
@@ -118,9 +134,421 @@ def decode_sets(obj):
         return set(obj["__set__"])
     return obj
 
-def contore_save():
-    with open("data/data.cont", "w") as f:
-        json.dump(data, f, default=encode_sets)
+SAVE_INTERVAL = 30 # seconds between background flushes of dirty data
+SAVE_MAX_PENDING = 500 # flush early once this many mutations have piled up
+
+# {section: set of dirty key paths, or None if the entire section is dirty}
+dirty_data = {}
+pending_saves = 0
+unwritten_data = None # snapshot that failed to write and has to be retried
+flush_lock = asyncio.Lock()
+storage = None # set up once the config has been read
+
+def contore_save(section: str = None, *path):
+    # marks data as changed; the actual write is deferred to contore_flush
+    # path is the chain of keys leading to the changed value (e.g. guild id, user id)
+    global pending_saves
+    if section is None:
+        for s in data:
+            dirty_data[s] = None
+    elif not path:
+        dirty_data[section] = None
+    else:
+        keys = dirty_data.setdefault(section, set())
+        if keys is not None:
+            keys.add(path)
+    pending_saves += 1
+    if pending_saves >= SAVE_MAX_PENDING and not flush_lock.locked():
+        try:
+            asyncio.get_running_loop().create_task(contore_flush())
+        except RuntimeError: # no running event loop, the next flush will pick it up
+            pass
+
+def take_dirty_data() -> dict:
+    global pending_saves
+    dirty = dict(dirty_data)
+    dirty_data.clear()
+    pending_saves = 0
+    return dirty
+
+def restore_dirty_data(dirty: dict):
+    # puts back what take_dirty_data took, merged with anything marked dirty since
+    global pending_saves
+    for section, paths in dirty.items():
+        if paths is None:
+            dirty_data[section] = None
+        elif dirty_data.get(section, set()) is not None:
+            dirty_data.setdefault(section, set()).update(paths)
+        pending_saves += 1
+
+def json_key(key) -> str:
+    return json.dumps(key if isinstance(key, str) else str(key))
+
+class JsonStorage:
+    # the original storage format: the whole data dict as one json file
+    def __init__(self, path: str = "data/data.cont"):
+        self.path = path
+        # {section: {key: serialized json}}, so clean keys don't get re-serialized on every flush
+        self.fragments = {}
+
+    def load(self) -> dict:
+        if not os.path.isfile(self.path):
+            with open(self.path, "w") as f:
+                json.dump(data, f)
+        with open(self.path, "r") as f:
+            return convert_keys_to_ints(json.load(f, object_hook=decode_sets)) # ints are more performant
+
+    def snapshot(self, dirty: dict) -> str:
+        # sections that have never been serialized have to be written out in full
+        dirty = {**dirty, **{section: None for section in data if section not in self.fragments}}
+        for section, paths in dirty.items():
+            value = data[section]
+            fragments = self.fragments.setdefault(section, {})
+            if paths is None:
+                fragments.clear()
+                keys = value.keys()
+            else:
+                keys = {p[0] for p in paths}
+            for key in keys:
+                if key in value:
+                    fragments[key] = json.dumps(value[key], default=encode_sets)
+                else:
+                    fragments.pop(key, None)
+        return "{" + ", ".join(json_key(section) + ": {" + ", ".join(json_key(k) + ": " + v for k, v in fragments.items()) + "}" for section, fragments in self.fragments.items()) + "}"
+
+    def write(self, payload: str):
+        # write to a temporary file first so a crash mid-write can't corrupt the real one
+        with open(self.path + ".tmp", "w") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(self.path + ".tmp", self.path)
+
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value
+);
+CREATE TABLE IF NOT EXISTS sections (
+    section TEXT,
+    key TEXT,
+    value TEXT,
+    PRIMARY KEY (section, key)
+);
+CREATE TABLE IF NOT EXISTS achievement_progress (
+    guild_id INTEGER,
+    user_id INTEGER,
+    metric TEXT,
+    value,
+    PRIMARY KEY (guild_id, user_id, metric)
+);
+CREATE TABLE IF NOT EXISTS achievements (
+    guild_id INTEGER,
+    user_id INTEGER,
+    achievement_id TEXT,
+    earned_at TEXT,
+    PRIMARY KEY (guild_id, user_id, achievement_id)
+);
+CREATE INDEX IF NOT EXISTS achievements_by_id ON achievements (guild_id, achievement_id);
+CREATE TABLE IF NOT EXISTS achievement_channels (
+    guild_id INTEGER PRIMARY KEY,
+    channel_id INTEGER
+);
+CREATE TABLE IF NOT EXISTS achievement_defs (
+    guild_id INTEGER,
+    position INTEGER,
+    achievement_id TEXT,
+    name TEXT,
+    description TEXT,
+    icon TEXT,
+    points INTEGER,
+    rarity TEXT,
+    type TEXT,
+    secret BOOLEAN,
+    trigger TEXT,
+    created_at TEXT,
+    PRIMARY KEY (guild_id, position)
+);
+CREATE UNIQUE INDEX IF NOT EXISTS achievement_defs_by_id ON achievement_defs (guild_id, achievement_id);
+CREATE TABLE IF NOT EXISTS quotes (
+    user_id INTEGER,
+    position INTEGER,
+    author_id INTEGER,
+    guild_id INTEGER,
+    channel_id INTEGER,
+    message_id INTEGER,
+    content TEXT,
+    created_at TEXT,
+    added_at TEXT,
+    snapshot TEXT,
+    PRIMARY KEY (user_id, position)
+);
+CREATE INDEX IF NOT EXISTS quotes_by_author ON quotes (user_id, author_id);
+CREATE TABLE IF NOT EXISTS families (
+    user_id INTEGER PRIMARY KEY,
+    title TEXT,
+    restrictions TEXT,
+    hidden TEXT
+);
+CREATE TABLE IF NOT EXISTS family_links (
+    user_id INTEGER,
+    relation TEXT,
+    target_id INTEGER,
+    PRIMARY KEY (user_id, relation, target_id)
+);
+CREATE TABLE IF NOT EXISTS birthdays (
+    user_id INTEGER PRIMARY KEY,
+    birthday TEXT
+);
+CREATE TABLE IF NOT EXISTS scheduled_roles (
+    guild_id INTEGER,
+    position INTEGER,
+    role_id INTEGER,
+    user_id INTEGER,
+    schedule TEXT,
+    PRIMARY KEY (guild_id, position)
+);
+CREATE INDEX IF NOT EXISTS scheduled_roles_by_user ON scheduled_roles (guild_id, user_id);
+"""
+
+def scoped(d: dict, path: tuple):
+    # items of d, narrowed down to the first key of path if there is one
+    if not isinstance(d, dict):
+        return
+    if not path:
+        yield from d.items()
+    elif path[0] in d:
+        yield path[0], d[path[0]]
+
+def dump_json(value) -> str:
+    return json.dumps(value, default=encode_sets)
+
+def load_json(value: str):
+    return convert_keys_to_ints(json.loads(value, object_hook=decode_sets))
+
+def progress_rows(section: dict, path: tuple):
+    for guild_id, users in scoped(section, path[:1]):
+        for user_id, metrics in scoped(users, path[1:2]):
+            for metric, value in metrics.items():
+                yield "achievement_progress", (guild_id, user_id, metric, value)
+
+def achievement_rows(section: dict, path: tuple):
+    for guild_id, users in scoped(section, path[:1]):
+        for user_id, earned in scoped(users, path[1:2]):
+            if user_id == "channel":
+                yield "achievement_channels", (guild_id, earned)
+            else:
+                for achievement_id, earned_at in earned.items():
+                    yield "achievements", (guild_id, user_id, achievement_id, earned_at)
+
+def achievement_def_rows(section: dict, path: tuple):
+    for guild_id, defs in scoped(section, path[:1]):
+        for i, ach in enumerate(defs if isinstance(defs, list) else []):
+            trigger = ach.get("trigger")
+            yield "achievement_defs", (guild_id, i, ach["id"], ach.get("name"), ach.get("description"), ach.get("icon"), ach.get("points"), ach.get("rarity"), ach.get("type"), ach.get("secret"), dump_json(trigger) if trigger is not None else None, ach.get("created_at"))
+
+def quote_rows(section: dict, path: tuple):
+    for user_id, quotes in scoped(section, path[:1]):
+        for i, quote in enumerate(quotes):
+            yield "quotes", (user_id, i, *quote[:7], dump_json(quote[7]) if len(quote) > 7 else None)
+
+def family_rows(section: dict, path: tuple):
+    for user_id, family in scoped(section, path[:1]):
+        restrictions = family.get("restrictions")
+        hidden = family.get("hidden")
+        yield "families", (user_id, family.get("title"), dump_json(restrictions) if restrictions is not None else None, dump_json(hidden) if hidden is not None else None)
+        for relation in ["partners", "children", "parents"]:
+            for target_id in family.get(relation, ()):
+                yield "family_links", (user_id, relation, target_id)
+
+def birthday_rows(section: dict, path: tuple):
+    for user_id, birthday in scoped(section, path[:1]):
+        yield "birthdays", (user_id, birthday)
+
+def scheduled_role_rows(section: dict, path: tuple):
+    for guild_id, schedules in scoped(section, path[:1]):
+        for i, schedule in enumerate(schedules):
+            yield "scheduled_roles", (guild_id, i, schedule.get("role_id"), schedule.get("user_id"), dump_json(schedule))
+
+# {section: (row function, {table: key columns})}
+# every other section is stored as json blobs in the generic `sections` table
+SQLITE_TABLES = {
+    "achievement_progress": (progress_rows, {"achievement_progress": ["guild_id", "user_id"]}),
+    "achievements": (achievement_rows, {"achievements": ["guild_id", "user_id"], "achievement_channels": ["guild_id"]}),
+    "achievement_defs": (achievement_def_rows, {"achievement_defs": ["guild_id"]}),
+    "quotes": (quote_rows, {"quotes": ["user_id"]}),
+    "families": (family_rows, {"families": ["user_id"], "family_links": ["user_id"]}),
+    "birthdays": (birthday_rows, {"birthdays": ["user_id"]}),
+    "scheduled_roles": (scheduled_role_rows, {"scheduled_roles": ["guild_id"]}),
+}
+
+def table_owns_path(table: str, path: tuple) -> bool:
+    # the announcement channel sits next to the users in data["achievements"][guild_id] but has its own table,
+    # so saving one user's achievements mustn't wipe the channel (and saving the channel mustn't wipe anyone's achievements)
+    if table == "achievement_channels":
+        return len(path) < 2 or path[1] == "channel"
+    if table == "achievements":
+        return len(path) < 2 or path[1] != "channel"
+    return True
+
+class SqliteStorage:
+    # row-level storage, so a flush only touches the rows belonging to dirty keys
+    def __init__(self, path: str = "data/contore.db"):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SQLITE_SCHEMA)
+        if "snapshot" not in [column[1] for column in self.conn.execute("PRAGMA table_info(quotes)")]:
+            self.conn.execute("ALTER TABLE quotes ADD COLUMN snapshot TEXT") # databases from before quote snapshots
+        self.columns = {}
+
+    def column_count(self, table: str) -> int:
+        if table not in self.columns:
+            self.columns[table] = len(self.conn.execute(f"PRAGMA table_info({table})").fetchall())
+        return self.columns[table]
+
+    def get_meta(self, key: str, default=None):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def load(self) -> dict:
+        if self.get_meta("migrated") is None:
+            self.migrate()
+        loaded = {section: {} for section in SQLITE_TABLES}
+        cursor = self.conn.cursor()
+
+        for section, key, value in cursor.execute("SELECT section, key, value FROM sections"):
+            loaded.setdefault(section, {})[int(key) if key.lstrip("-").isdigit() else key] = load_json(value)
+
+        for guild_id, user_id, metric, value in cursor.execute("SELECT guild_id, user_id, metric, value FROM achievement_progress"):
+            loaded["achievement_progress"].setdefault(guild_id, {}).setdefault(user_id, {})[metric] = value
+
+        for guild_id, user_id, achievement_id, earned_at in cursor.execute("SELECT guild_id, user_id, achievement_id, earned_at FROM achievements"):
+            loaded["achievements"].setdefault(guild_id, {}).setdefault(user_id, {})[achievement_id] = earned_at
+        for guild_id, channel_id in cursor.execute("SELECT guild_id, channel_id FROM achievement_channels"):
+            loaded["achievements"].setdefault(guild_id, {})["channel"] = channel_id
+
+        for row in cursor.execute("SELECT guild_id, achievement_id, name, description, icon, points, rarity, type, secret, trigger, created_at FROM achievement_defs ORDER BY guild_id, position"):
+            ach = {"id": row[1], "name": row[2], "description": row[3], "icon": row[4], "points": row[5], "rarity": row[6], "type": row[7], "secret": bool(row[8]), "created_at": row[10]}
+            if row[9] is not None:
+                ach["trigger"] = load_json(row[9])
+            loaded["achievement_defs"].setdefault(row[0], []).append(ach)
+
+        for row in cursor.execute("SELECT user_id, author_id, guild_id, channel_id, message_id, content, created_at, added_at, snapshot FROM quotes ORDER BY user_id, position"):
+            loaded["quotes"].setdefault(row[0], []).append(list(row[1:8]) + ([load_json(row[8])] if row[8] else []))
+
+        for user_id, title, restrictions, hidden in cursor.execute("SELECT user_id, title, restrictions, hidden FROM families"):
+            family = {"partners": set(), "children": set(), "parents": set(), "title": title}
+            if restrictions is not None:
+                family["restrictions"] = load_json(restrictions)
+            if hidden is not None:
+                family["hidden"] = load_json(hidden)
+            loaded["families"][user_id] = family
+        for user_id, relation, target_id in cursor.execute("SELECT user_id, relation, target_id FROM family_links"):
+            loaded["families"][user_id][relation].add(target_id)
+
+        for user_id, birthday in cursor.execute("SELECT user_id, birthday FROM birthdays"):
+            loaded["birthdays"][user_id] = birthday
+
+        for guild_id, schedule in cursor.execute("SELECT guild_id, schedule FROM scheduled_roles ORDER BY guild_id, position"):
+            loaded["scheduled_roles"].setdefault(guild_id, []).append(load_json(schedule))
+
+        return loaded
+
+    def migrate(self):
+        # one-shot import of the old data.cont file
+        old = JsonStorage()
+        if os.path.isfile(old.path):
+            print(f"Migrating {old.path} to {self.path}...")
+            for key, value in old.load().items():
+                data[key] = value
+            self.write(self.snapshot({section: None for section in data}))
+            os.replace(old.path, old.path + ".migrated")
+        with self.conn:
+            self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('migrated', ?)", (datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"),))
+
+    def snapshot(self, dirty: dict) -> list:
+        # builds the list of statements to run; rows are copied out here so the write can happen off the event loop
+        ops = []
+        for section, paths in dirty.items():
+            value = data[section]
+            for path in [()] if paths is None else paths:
+                if section in SQLITE_TABLES:
+                    rows, tables = SQLITE_TABLES[section]
+                    for table, keys in tables.items():
+                        if not table_owns_path(table, path):
+                            continue
+                        prefix = path[:len(keys)]
+                        ops.append((f"DELETE FROM {table}" + (" WHERE " + " AND ".join(f"{k} = ?" for k in keys[:len(prefix)]) if prefix else ""), [prefix]))
+                    inserts = {}
+                    for table, row in rows(value, path):
+                        inserts.setdefault(table, []).append(row)
+                else:
+                    if path:
+                        ops.append(("DELETE FROM sections WHERE section = ? AND key = ?", [(section, str(path[0]))]))
+                    else:
+                        ops.append(("DELETE FROM sections WHERE section = ?", [(section,)]))
+                    inserts = {"sections": [(section, str(k), dump_json(v)) for k, v in scoped(value, path[:1])]}
+                for table, params in inserts.items():
+                    ops.append((f"INSERT OR REPLACE INTO {table} VALUES ({', '.join('?' * self.column_count(table))})", params))
+        return ops
+
+    def write(self, ops: list):
+        with self.conn:
+            for sql, params in ops:
+                self.conn.executemany(sql, params)
+
+def has_unsaved_data() -> bool:
+    return pending_saves > 0 or unwritten_data is not None or progress_counters.has_pending()
+
+def take_snapshot():
+    # must happen on the event loop so data isn't mutated mid-dump
+    segment = progress_counters.drain()
+    dirty = take_dirty_data()
+    try:
+        return storage.snapshot(dirty), segment
+    except Exception:
+        # the drained progress rows are among the dirty paths, so the next flush writes them (before their journal segment is deleted)
+        restore_dirty_data(dirty)
+        raise
+
+async def contore_flush():
+    global unwritten_data
+    async with flush_lock:
+        if not has_unsaved_data():
+            return
+        try:
+            if unwritten_data is None:
+                unwritten_data = take_snapshot()
+            await asyncio.to_thread(storage.write, unwritten_data[0])
+            progress_counters.commit(unwritten_data[1])
+            unwritten_data = None
+            if pending_saves > 0 or progress_counters.has_pending():
+                unwritten_data = take_snapshot()
+                await asyncio.to_thread(storage.write, unwritten_data[0])
+                progress_counters.commit(unwritten_data[1])
+                unwritten_data = None
+        except (OSError, sqlite3.Error, TypeError, ValueError) as e:
+            print(f"Failed to save data: {e}")
+
+def contore_flush_sync():
+    global unwritten_data
+    if not has_unsaved_data():
+        return
+    if unwritten_data is None:
+        unwritten_data = take_snapshot()
+    storage.write(unwritten_data[0])
+    progress_counters.commit(unwritten_data[1])
+    unwritten_data = None
+    if pending_saves > 0 or progress_counters.has_pending():
+        snapshot, segment = take_snapshot()
+        storage.write(snapshot)
+        progress_counters.commit(segment)
+
+@tasks.loop(seconds=SAVE_INTERVAL)
+async def flush_data():
+    await contore_flush()
 
 class Yes(View):
     def __init__(self, users: list = None, confirm_text: str = "Confirming...", confirm: dict = {"ephemeral": True}, deny_text: str = "Denying...", deny: dict = {"ephemeral": True}):
@@ -212,7 +640,7 @@ async def auto_role(ctx: Interaction, role: Role, user: User = None):
             data["auto_roles"][ctx.guild_id][user.id] = []
         print(f"{user.display_name} will automatically receive the role `{role.name}` when joining the server.") # logging purposes
         await ctx.response.send_message(f"{user.display_name} will automatically receive the role `{role.name}` when joining the server.", ephemeral=True)
-    contore_save()
+    contore_save("auto_roles", ctx.guild_id)
 
 @message_commands.command(name="role", description="Automatically grant/revoke roles when a message is sent")
 @app_commands.describe(role = "The role to automatically apply to the target",
@@ -260,13 +688,14 @@ async def role_on_message(ctx: Interaction, role: Role, content: str, type: Lite
     elif authorization_level == "Specific Role":
         params["authorization"] = authorized_role.id
     data["roles_on_messages"][ctx.guild_id].append(params)
+    recompile_message_roles(ctx.guild_id)
     print(data["roles_on_messages"][ctx.guild_id])
     
     content = f"""{"Grants" if not params.get("take", False) else "Takes away"} the role <@&{params["role"]}> to {"the author of the sent message" if params["type"] == "Self" else f"<@{params.get('type_user', 0)}>" if params["type"] == "Specified User" else "mentioned users/roles"}
 {"Messages must be sent by Alfred" if params["authorization_type"] == "Alfred" else "Messages must be sent by an administrator" if params["authorization_type"] == "Administrators" else f"Messages must be sent by someone with the <@&{params.get('authorization', 0)} role" if params["authorization_type"] == "Specified Role" else f"Messages must be sent by <@{params.get('authorization', 0)}>" if params["authorization_type"] == "Specified User" else "Anybody can use trigger this function"}""" + (f"\nAfter {params.get('time_limit', 0)} seconds, all roles granted will be revoked" if params.get('time_limit', -1) > 0 else "") + f"""
 To trigger this, """ + (f"you must send \"{params['content']}\" as a message" if not params.get("sub_match", False) else f"your message must contain \"{params['content']}\" in it")
 
-    contore_save()
+    contore_save("roles_on_messages", ctx.guild_id)
     print(content) # logging purposes
     await ctx.response.send_message(content, ephemeral=True)
 
@@ -315,17 +744,28 @@ async def schedule_role(ctx: Interaction, role: Role, user: Member, date_pattern
         elif re.fullmatch(r"\d{2}-\d{2}", date_pattern):
             date_type = "annual"
             duration = duration if duration != None else 24
+            try:
+                datetime(4, *map(int, date_pattern.split("-"))) # a leap year, so 02-29 is allowed
+            except ValueError:
+                await ctx.response.send_message("Invalid date. Please provide a real month and day, e.g. '12-25'.")
+                return
 
         # Recurring month-long role (MM)
         elif re.fullmatch(r"\d{2}M", date_pattern):
             date_pattern = date_pattern[:2]
             date_type = "monthly"
             duration = duration if duration != None else 730
+            if not 1 <= int(date_pattern) <= 12:
+                await ctx.response.send_message("Invalid month. Please provide a month between 01M and 12M.")
+                return
 
         # Monthly recurring day role (DD)
         elif re.fullmatch(r"\d{2}", date_pattern):
             date_type = "monthly-day"
             duration = duration if duration != None else 24
+            if not 1 <= int(date_pattern) <= 31:
+                await ctx.response.send_message("Invalid day. Please provide a day between 01 and 31.")
+                return
 
         else:
             await ctx.response.send_message("Invalid date pattern. Use one of the following formats: 'YYYY-MM-DD', 'YYYY-MM', 'YYYY', 'MM-DD', 'MM', 'DD'.")
@@ -355,13 +795,48 @@ async def schedule_role(ctx: Interaction, role: Role, user: Member, date_pattern
         if ctx.guild.id not in data["scheduled_roles"]:
             data["scheduled_roles"][ctx.guild.id] = [ ]
         data["scheduled_roles"][ctx.guild.id].append(date_info)
-        contore_save()
+        contore_save("scheduled_roles", ctx.guild.id)
+        if scheduler_task is not None:
+            plan_schedule(ctx.guild.id, date_info)
 
         await ctx.response.send_message(f"Scheduled role '{role.name}' for '{user.display_name}' on pattern '{date_pattern}' with duration {duration:,} hours.")
     except Exception as e:
         await ctx.response.send_message("An error occurred while scheduling the role. Please check your inputs.")
         print(f"Error in schedule_role command: {e}")
 
+birthday_index = None # {(month, day): {user_id}}
+
+def birthday_key(birthday_info: str):
+    _, month, day = birthday_info.split("-")
+    return int(month), int(day)
+
+def get_birthday_index() -> dict:
+    global birthday_index
+    if birthday_index is None:
+        birthday_index = {}
+        for user_id, birthday_info in data["birthdays"].items():
+            birthday_index.setdefault(birthday_key(birthday_info), set()).add(user_id)
+    return birthday_index
+
+def index_birthday(user_id: int):
+    get_birthday_index().setdefault(birthday_key(data["birthdays"][user_id]), set()).add(user_id)
+
+def unindex_birthday(user_id: int):
+    if user_id not in data["birthdays"]:
+        return
+    key = birthday_key(data["birthdays"][user_id])
+    users = get_birthday_index().get(key)
+    if users:
+        users.discard(user_id)
+        if not users:
+            del birthday_index[key]
+
+def birthdays_on(date) -> set:
+    users = get_birthday_index().get((date.month, date.day), set())
+    if date.month == 2 and date.day == 28 and not calendar.isleap(date.year):
+        users = users | get_birthday_index().get((2, 29), set()) # leap day birthdays are celebrated on the 28th
+    return users
+
 @birthday_commands.command(name="set", description="Set your birthday!")
 @app_commands.describe(date="The birthday date in format YYYY-MM-DD or MM-DD.")
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
@@ -384,14 +859,18 @@ async def birthday_set(ctx: Interaction, date: str):
             month, day = date_parts
             if not (len(month) == 2 and int(month) < 13 and int(month) > 0 and len(day) == 2 and int(day) < 32 and int(day) > 0):
                 raise ValueError("Invalid MM-DD")
-            birthday = datetime(year=1, month=int(month), day=int(day))
+            birthday = datetime(year=4, month=int(month), day=int(day)) # leap year so that 02-29 is valid
         else:
             await ctx.response.send_message("Invalid date format. Please use 'YYYY-MM-DD' or 'MM-DD'.")
             return
 
         # Save birthday in the data structure
+        unindex_birthday(ctx.user.id)
         data["birthdays"][ctx.user.id] = birthday.strftime("%Y-%m-%d") if len(date_parts) == 3 else "0000-" + birthday.strftime("%m-%d")
-        contore_save()
+        contore_save("birthdays", ctx.user.id)
+        index_birthday(ctx.user.id)
+        if scheduler_task is not None:
+            call_at(datetime.now(), celebrate_birthdays)
         await ctx.response.send_message(f"Your birthday has been set to {birthday.strftime('%Y-%m-%d' if len(date_parts) == 3 else '%m-%d')}.")
     except ValueError:
         await ctx.response.send_message("Invalid date format. Please enter a valid date.")
@@ -400,8 +879,11 @@ async def birthday_set(ctx: Interaction, date: str):
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
 async def birthday_forget(ctx: Interaction):
     if ctx.user.id in data["birthdays"]:
+        unindex_birthday(ctx.user.id)
         del data["birthdays"][ctx.user.id]
-        contore_save()
+        contore_save("birthdays", ctx.user.id)
+        if scheduler_task is not None:
+            call_at(datetime.now(), celebrate_birthdays)
         await ctx.response.send_message("Your birthday has been forgotten.")
     else:
         await ctx.response.send_message("You don't have a birthday set!")
@@ -417,10 +899,10 @@ async def birthdays(ctx: Interaction):
         if not user:
             continue
 
-        birth_date = datetime.strptime(birthday_info if not birthday_info.startswith("0000-") else birthday_info[5:], "%Y-%m-%d" if not birthday_info.startswith("0000-") else "%m-%d")
-        birth_date_this_year = birth_date.replace(year=now.year)
+        month, day = birthday_key(birthday_info)
+        birth_date_this_year = clamp_date(now.year, month, day)
         if birth_date_this_year < now:
-            birth_date_this_year = birth_date.replace(year=now.year + 1)
+            birth_date_this_year = clamp_date(now.year + 1, month, day)
         
         days_until = (birth_date_this_year - now).days
         upcoming_birthdays.append((user.display_name, birth_date_this_year, days_until))
@@ -442,7 +924,8 @@ async def birthdays(ctx: Interaction):
 async def birthday(ctx: Interaction, user: User = None):
     user = user or ctx.user
     if user.id in data["birthdays"]:
-        birth_date = datetime.strptime(data["birthdays"][user.id] if not data["birthdays"][user.id].startswith("0000-") else data["birthdays"][user.id][5:], "%Y-%m-%d" if not data["birthdays"][user.id].startswith("0000-") else "%m-%d")
+        month, day = birthday_key(data["birthdays"][user.id])
+        birth_date = datetime(4, month, day)
         await ctx.response.send_message(f"**{user.display_name}**'s birthday is on {birth_date.strftime('%B %d')} 🎉")
     else:
         await ctx.response.send_message(f"**{user.display_name}** has not set a birthday :c")
@@ -458,7 +941,7 @@ async def birthday_role(ctx: Interaction, role: Role = None):
     if not ctx.guild_id in data["birthday_data"]:
         data["birthday_data"][ctx.guild_id] = [-1, -1]
     data["birthday_data"][ctx.guild_id][0] = role.id if role else -1
-    contore_save()
+    contore_save("birthday_data", ctx.guild_id)
     await ctx.response.send_message(f"The birthday role has been set to {role.mention}.", ephemeral=True)
 
 @birthday_commands.command(name="channel", description="Set a channel for Contore to send happy birthday messages in!")
@@ -475,7 +958,7 @@ async def birthday_channel(ctx: Interaction, channel: Union[GuildChannel, Thread
     if not ctx.guild_id in data["birthday_data"]:
         data["birthday_data"][ctx.guild_id] = [-1, -1]
     data["birthday_data"][ctx.guild_id][1] = channel.id if channel else -1
-    contore_save()
+    contore_save("birthday_data", ctx.guild_id)
     await ctx.response.send_message(f"Birthday announcements will be sent to {channel.mention}.", ephemeral=True)
 
 @reset_commands.command(name="roles", description="Resets all role data (does not revert damage to your server or revoke roles granted)")
@@ -486,7 +969,9 @@ async def reset_roles(ctx: Interaction):
         return
     data["auto_roles"][ctx.guild_id] = { }
     data["roles_on_messages"][ctx.guild_id] = [ ]
-    contore_save()
+    recompile_message_roles(ctx.guild_id)
+    contore_save("auto_roles", ctx.guild_id)
+    contore_save("roles_on_messages", ctx.guild_id)
     await ctx.response.send_message("Successfully reset all role data for this server.", ephemeral=True)
 
 @reset_commands.command(name="role", description="Resets auto role data for a specific user")
@@ -501,7 +986,7 @@ async def reset_role(ctx: Interaction, user: User = None):
         data["auto_roles"][ctx.guild_id].pop(id)
     else:
         data["auto_roles"][ctx.guild_id]["everyone"] = []
-    contore_save()
+    contore_save("auto_roles", ctx.guild_id)
     await ctx.response.send_message(f"Successfully removed all auto role data for {user.name if user else id}.")
 
 @reset_commands.command(name="reactions", description="Resets all auto reaction data")
@@ -511,7 +996,8 @@ async def reset_autoreactions(ctx: Interaction):
         await ctx.response.send_message("no")
         return
     data["autoreactions"][ctx.guild_id] = [ ]
-    contore_save()
+    autoreaction_indexes.pop(ctx.guild_id, None)
+    contore_save("autoreactions", ctx.guild_id)
     await ctx.response.send_message("Successfully reset all autoreaction data for this server.", ephemeral=True)
     
 @ctree.command(name="list", description="Lists all of the data related to roles that Contore has of the current server")
@@ -560,17 +1046,55 @@ async def list_data(ctx: Interaction):
         pages = split_string_by_new_line(msg)
         await ctx.response.send_message(embed=Embed(title="Page 1", description=pages[0]), view=MultipageMessage(pages))
 
-def download_image_from_url(url: str):
-    folder = "data/Contore/avis/"
-    os.makedirs(folder, exist_ok=True)
-    filename = os.path.join(folder, f"{url.split('/')[-2]}-{url.split('/')[-1].split('?')[0]}.png")
+AVATAR_FOLDER = "data/Contore/avis/"
+AVATAR_CACHE_MAX_BYTES = 64 * 1024 * 1024
+AVATAR_MAX_AGE = 7 * 24 * 60 * 60 # seconds before a cached avatar is revalidated
+AVATAR_CONCURRENCY = 8
 
-    if not os.path.exists(filename):
-        response = get(url)
-        if response.status_code == 200:
-            with open(filename, 'wb') as f:
-                f.write(response.content)
+avatar_client = AsyncClient(timeout=10)
+avatar_limit = asyncio.Semaphore(AVATAR_CONCURRENCY)
 
+def avatar_filename(url: str):
+    return os.path.join(AVATAR_FOLDER, f"{url.split('/')[-2]}-{url.split('/')[-1].split('?')[0]}.png")
+
+async def download_image_from_url(url: str):
+    # returns the path of the cached image, or None if it couldn't be downloaded
+    # other tree commands can evict the cache at any moment, so a file that's gone is treated as a cache miss
+    os.makedirs(AVATAR_FOLDER, exist_ok=True)
+    filename = avatar_filename(url)
+    etag_file = filename + ".etag" # holds the ETag, its mtime is when the image was last validated
+    try:
+        validated_at = os.path.getmtime(etag_file)
+    except OSError:
+        validated_at = None
+    if validated_at is not None and time.time() - validated_at < AVATAR_MAX_AGE and touch(filename):
+        return filename
+
+    headers = {}
+    if validated_at is not None and os.path.exists(filename):
+        try:
+            with open(etag_file, "r") as f:
+                etag = f.read()
+        except OSError:
+            etag = None
+        if etag:
+            headers["If-None-Match"] = etag
+    try:
+        async with avatar_limit:
+            response = await avatar_client.get(url, headers=headers)
+            if response.status_code == 304 and not (touch(filename) and touch(etag_file)):
+                # evicted since it was checked, so it has to be downloaded after all
+                response = await avatar_client.get(url)
+    except HTTPError as e:
+        print(f"Couldn't download avatar {url}: {e}")
+        return filename if os.path.exists(filename) else None
+
+    if response.status_code == 200:
+        write_atomically(filename, response.content)
+        with open(etag_file, "w") as f:
+            f.write(response.headers.get("ETag", ""))
+    elif response.status_code != 304 and not os.path.exists(filename):
+        return None
     return filename
 
 async def build_family_graph(guild_id: Union[int, None], root_id: int, unstylize_lines: bool = False, show_usernames: bool = False):
@@ -585,16 +1109,46 @@ async def build_family_graph(guild_id: Union[int, None], root_id: int, unstylize
     drawn_people = set()
     drawn_edges = set()
 
+    people = {} # {person_id: user}
+    avatars = {} # {person_id: cached avatar path}
+    guild = contore.get_guild(guild_id) or await contore.fetch_guild(guild_id) if guild_id else None
+
+    async def resolve_person(person_id: int):
+        try:
+            user = guild.get_member(person_id) or await guild.fetch_member(person_id) if guild else contore.get_user(person_id) or await contore.fetch_user(person_id)
+        except Exception:
+            try:
+                user = contore.get_user(person_id) or await contore.fetch_user(person_id)
+            except Exception:
+                user = None
+        people[person_id] = user
+        if user and user.display_avatar:
+            avatars[person_id] = await download_image_from_url(user.display_avatar.with_size(64).url)
+
+    # look everyone in the tree up (and download their avatars) concurrently before drawing anything
+    hidden = data["families"].get(root_id, {}).get("hidden", set())
+    reachable = {root_id}
+    queue = deque([root_id])
+    while queue:
+        person = data["families"].get(queue.popleft())
+        if not person:
+            continue
+        for relative in chain(person["parents"], person["partners"], person["children"]):
+            if relative not in reachable:
+                reachable.add(relative)
+                if relative not in hidden:
+                    queue.append(relative)
+    await asyncio.gather(*(resolve_person(person_id) for person_id in reachable))
+    await asyncio.to_thread(evict_cache, AVATAR_FOLDER, AVATAR_CACHE_MAX_BYTES)
+
     async def add_person_node(person_id: int, guild_id: int):
         if person_id in drawn_people:
             return
         drawn_people.add(person_id)
 
-        guild = contore.get_guild(guild_id) or await contore.fetch_guild(guild_id) if guild_id else None
-        try:
-            user = guild.get_member(person_id) or await guild.fetch_member(person_id) if guild else contore.get_user(person_id) or await contore.fetch_user(person_id)
-        except Exception:
-            user = contore.get_user(person_id) or await contore.fetch_user(person_id)
+        if person_id not in people:
+            await resolve_person(person_id)
+        user = people[person_id]
         if user is None:
             name = "Unknown User"
             discriminator = None
@@ -606,7 +1160,7 @@ async def build_family_graph(guild_id: Union[int, None], root_id: int, unstylize
             discriminator = user.discriminator if user.bot else None
             username = user.name
             title = data["families"].get(person_id, {}).get("title", None)
-            image_path = download_image_from_url(user.display_avatar.with_size(64).url) if user.display_avatar else None
+            image_path = avatars.get(person_id)
 
         # custom label
         label = f'''<
@@ -626,10 +1180,6 @@ async def build_family_graph(guild_id: Union[int, None], root_id: int, unstylize
 
         g.node(str(person_id), label=label, shape='none', style='filled', fillcolor='transparent')
 
-    def is_grandchild_of(person_id: int, check_id: int, depth: int = 0):
-        person = data["families"].get(person_id)
-        return not person and (depth > 0 and check_id in person["children"] or any(is_grandchild_of(child_id, check_id, depth + 1) for child_id in person["children"]))
-
     def get_partner_cluster(person_id: int, root_id: int):
         hidden = data["families"].get(root_id, {}).get("hidden", set())
         cluster = set()
@@ -655,7 +1205,7 @@ async def build_family_graph(guild_id: Union[int, None], root_id: int, unstylize
 
         # parents
         for parent_id in sorted(person["parents"]):
-            if not is_grandchild_of(person_id, parent_id):
+            if not family_graph.is_grandchild_of(person_id, parent_id):
                 parent = data["families"].get(parent_id)
                 if parent and (parent_id not in person["children"] or len(parent["children"]) < len(person["children"])):
                     await draw_family(parent_id, visited)
@@ -721,10 +1271,66 @@ async def build_family_graph(guild_id: Union[int, None], root_id: int, unstylize
     await draw_family(root_id, visited=data["families"].get(root_id, {}).get("hidden", set()).copy())
     return g
 
+TREE_CACHE_FOLDER = "data/Contore/trees/"
+TREE_CACHE_MAX_BYTES = 256 * 1024 * 1024
+
 def render_graph_image(g: Digraph):
-    img_bytes = g.pipe(format='png')
+    # renders are cached by the hash of the DOT source, which already contains every name, title, avatar path and option drawn
+    os.makedirs(TREE_CACHE_FOLDER, exist_ok=True)
+    filename = os.path.join(TREE_CACHE_FOLDER, hashlib.sha256(g.source.encode()).hexdigest() + ".png")
+    try:
+        with open(filename, "rb") as f:
+            img_bytes = f.read()
+        touch(filename)
+    except FileNotFoundError:
+        img_bytes = g.pipe(format='png')
+        write_atomically(filename, img_bytes)
+        evict_cache(TREE_CACHE_FOLDER, TREE_CACHE_MAX_BYTES)
     return BytesIO(img_bytes)
 
+def write_atomically(filename: str, content: bytes):
+    # concurrent writers (two renders of the same tree, two trees sharing an avatar) each get their own temporary file
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(filename), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(content)
+        os.replace(temp_path, filename)
+    except BaseException:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        raise
+
+def touch(path: str) -> bool:
+    # marks a cached file as recently used, False if another command evicted it in the meantime
+    try:
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+def evict_cache(folder: str, max_bytes: int):
+    # least recently used (by mtime) images go first once the folder is over its size limit
+    entries = []
+    for entry in os.scandir(folder):
+        if entry.name.endswith(".png"):
+            try:
+                stat = entry.stat()
+            except OSError: # evicted by another command running at the same time
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        for stale in [path, path + ".etag"]:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+        total -= size
+
 def add_family_data(user_id: int):
     data["families"][user_id] = {
         "partners": set(),
@@ -738,28 +1344,53 @@ def add_family_data(user_id: int):
         "hidden": set()
     }
 
-def is_ancestor(user_id: int, target_id: int, visited=None):
-    if visited is None:
-        visited = set()
-    if user_id in visited:
-        return False
-    visited.add(user_id)
+class FamilyGraph:
+    # transitive closures of the parent/child links in data["families"], memoized until the families change
+    def __init__(self):
+        self.ancestor_sets = {} # {user_id: frozenset of every ancestor}
+        self.descendant_sets = {} # {user_id: frozenset of every descendant}
+
+    def invalidate(self):
+        self.ancestor_sets.clear()
+        self.descendant_sets.clear()
+
+    def closure(self, user_id: int, key: str, cache: dict) -> frozenset:
+        if user_id not in cache:
+            # iterative BFS so long chains can't hit the recursion limit and cycles (someone adopting their own parent) terminate
+            found = set()
+            queue = deque(data["families"].get(user_id, {}).get(key, ()))
+            while queue:
+                relative = queue.popleft()
+                if relative in found:
+                    continue
+                found.add(relative)
+                if relative in cache: # reuse closures that are already known
+                    found.update(cache[relative])
+                else:
+                    queue.extend(data["families"].get(relative, {}).get(key, ()))
+            cache[user_id] = frozenset(found)
+        return cache[user_id]
 
-    for parent in data["families"].get(user_id, {}).get("parents", set()):
-        if parent == target_id or is_ancestor(parent, target_id, visited):
-            return True
-    return False
+    def ancestors(self, user_id: int) -> frozenset:
+        return self.closure(user_id, "parents", self.ancestor_sets)
+
+    def descendants(self, user_id: int) -> frozenset:
+        return self.closure(user_id, "children", self.descendant_sets)
+
+    def is_ancestor(self, ancestor_id: int, user_id: int) -> bool:
+        return ancestor_id in self.ancestors(user_id)
+
+    def is_grandchild_of(self, person_id: int, check_id: int) -> bool:
+        # whether check_id is a grandchild (or further descendant) of person_id
+        return any(check_id in self.descendants(child_id) for child_id in data["families"].get(person_id, {}).get("children", ()))
+
+family_graph = FamilyGraph()
+
+def is_ancestor(user_id: int, target_id: int):
+    return family_graph.is_ancestor(target_id, user_id)
 
 def check_restrictions(actor_id: int, target_id: int):
-    def get_ancestors(uid):
-        ancestors = set()
-        for p in data["families"].get(uid, {}).get("parents", []):
-            if p in ancestors:
-                ancestors.add(p)
-                ancestors.update(get_ancestors(p))
-        return ancestors
-
-    for ancestor in get_ancestors(actor_id):
+    for ancestor in family_graph.ancestors(actor_id):
         anc_fam = data["families"].get(ancestor, {})
         restrictions = anc_fam.get("restrictions")
         if restrictions is None:
@@ -781,7 +1412,7 @@ async def tree(ctx: Interaction, user: User = None, straight_lines: bool = False
         add_family_data(user.id)
     await ctx.response.defer()
     g = await build_family_graph(ctx.guild.id if ctx.guild else None, user.id, straight_lines, show_usernames)
-    img = render_graph_image(g)
+    img = await asyncio.to_thread(render_graph_image, g) # dot takes a while at 300 dpi, keep it off the event loop
     await ctx.followup.send(file=File(img, filename='family_tree.png'))
 
 def modify_families_data(user_id: int, key: str, target_id: int, target_key: str):
@@ -792,7 +1423,9 @@ def modify_families_data(user_id: int, key: str, target_id: int, target_key: str
 
     data["families"][user_id][key].add(target_id)
     data["families"][target_id][target_key].add(user_id)
-    contore_save()
+    family_graph.invalidate()
+    contore_save("families", user_id)
+    contore_save("families", target_id)
 
 @ctree.command(name="marry", description="Propose marriage to someone")
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
@@ -829,7 +1462,9 @@ async def divorce(ctx: Interaction, user: User):
         if yes.value:
             data["families"][ctx.user.id]["partners"].remove(user.id)
             data["families"][user.id]["partners"].remove(ctx.user.id)
-            contore_save()
+            family_graph.invalidate()
+            contore_save("families", ctx.user.id)
+            contore_save("families", user.id)
 
 @ctree.command(name="adopt", description="Propose adoption to someone")
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
@@ -866,7 +1501,9 @@ async def disown(ctx: Interaction, user: User):
         if yes.value:
             data["families"][ctx.user.id]["children"].remove(user.id)
             data["families"][user.id]["parents"].remove(ctx.user.id)
-            contore_save()
+            family_graph.invalidate()
+            contore_save("families", ctx.user.id)
+            contore_save("families", user.id)
 
 @ctree.command(name="makeparent", description="Choose a user to ask to be your parent")
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
@@ -906,7 +1543,8 @@ async def runaway(ctx: Interaction, user: User = None):
                 for parent in data["families"][ctx.user.id]["parents"]:
                     data["families"][parent]["children"].remove(ctx.user.id)
                 data["families"][ctx.user.id]["parents"] = set()
-            contore_save()
+            family_graph.invalidate()
+            contore_save("families")
 
 @ctree.command(name="title", description="Choose a title to display on your family tree")
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
@@ -919,7 +1557,7 @@ async def title(ctx: Interaction, title: str = None):
         else:
             data["families"][ctx.user.id]["title"] = title
 
-        contore_save()
+        contore_save("families", ctx.user.id)
 
         await ctx.response.send_message(f"Your title has been set to `{title}`." if title else "Your title has been removed.")
 
@@ -937,7 +1575,7 @@ async def restriction_mode(ctx: Interaction, mode: Literal["Blacklist", "Whiteli
         return
     
     data["families"][ctx.user.id]["restrictions"]["mode"] = mode
-    contore_save()
+    contore_save("families", ctx.user.id)
 
     await ctx.response.send_message(f"Your default restriction mode is now **{mode}**.", ephemeral=True)
 
@@ -979,7 +1617,7 @@ async def restriction_set(ctx: Interaction, child: User, target: User, mode: Lit
             entry["mode"] = mode
         msg = f"Added {target.mention} to {child.mention}'s {entry['mode']}."
 
-    contore_save()
+    contore_save("families", ctx.user.id)
     
     await ctx.response.send_message(msg, allowed_mentions=AllowedMentions.none())
 
@@ -1000,7 +1638,7 @@ async def hidefromtree(ctx: Interaction, user: User):
         hidden.add(user.id)
         msg = f"{user.mention} (and their descendants) are now hidden from your family tree."
 
-    contore_save()
+    contore_save("families", ctx.user.id)
     
     await ctx.response.send_message(msg, allowed_mentions=AllowedMentions.none())
 
@@ -1015,7 +1653,9 @@ async def forcedivorce(ctx: Interaction, user1: User, user2: User):
 
     data["families"][user1.id]["partners"].remove(user2.id)
     data["families"][user2.id]["partners"].remove(user1.id)
-    contore_save()
+    family_graph.invalidate()
+    contore_save("families", user1.id)
+    contore_save("families", user2.id)
 
     await ctx.response.send_message(f"Forcefully divorced {user1.mention} and {user2.mention}.", allowed_mentions=AllowedMentions.none())
 
@@ -1028,8 +1668,10 @@ async def forceseparate(ctx: Interaction, parent: User, child: User):
         data["families"][parent.id]["children"].remove(child.id)
     if parent.id in data["families"][child.id].get("parents", []):
         data["families"][child.id]["parents"].remove(parent.id)
+    family_graph.invalidate()
 
-    contore_save()
+    contore_save("families", parent.id)
+    contore_save("families", child.id)
 
     await ctx.response.send_message(f"Forcefully removed parent-child bond between {parent.mention} and {child.mention}.", allowed_mentions=AllowedMentions.none())
 
@@ -1045,7 +1687,9 @@ async def forcemarry(ctx: Interaction, user1: User, user2: User):
 
     data["families"][user1.id]["partners"].add(user2.id)
     data["families"][user2.id]["partners"].add(user1.id)
-    contore_save()
+    family_graph.invalidate()
+    contore_save("families", user1.id)
+    contore_save("families", user2.id)
 
     await ctx.response.send_message(f"Forcefully married {user1.mention} and {user2.mention}.", allowed_mentions=AllowedMentions.none())
 
@@ -1061,7 +1705,9 @@ async def forceadopt(ctx: Interaction, parent: User, child: User):
 
     data["families"][parent.id]["children"].add(child.id)
     data["families"][child.id]["parents"].add(parent.id)
-    contore_save()
+    family_graph.invalidate()
+    contore_save("families", parent.id)
+    contore_save("families", child.id)
 
     await ctx.response.send_message(f"Forcefully created a parent-child bond between {parent.mention} and {child.mention}.", allowed_mentions=AllowedMentions.none())
 
@@ -1075,17 +1721,112 @@ def init_achievement_progress(guild_id: int, user_id: int):
             "voice_minutes": 0.0
         }
 
+PROGRESS_JOURNAL = "data/progress.journal"
+
+class ProgressCounters:
+    # the hottest write path in the bot: every message and reaction bumps a counter
+    # increments are applied to data["achievement_progress"] right away so reads stay current,
+    # but they're only handed to the storage backend in bulk when data is flushed
+    # every increment is also appended to a journal segment, so a crash between flushes loses nothing
+    def __init__(self, path: str = PROGRESS_JOURNAL):
+        self.path = path
+        self.pending = {} # {guild_id: {user_id: {metric: delta}}}
+        self.pending_count = 0
+        self.segment = 0
+        self.journal = None
+
+    def segment_path(self, segment: int) -> str:
+        return f"{self.path}.{segment}"
+
+    def segments(self) -> list[int]:
+        folder, name = os.path.split(self.path)
+        found = []
+        for filename in os.listdir(folder or "."):
+            if filename.startswith(name + ".") and filename[len(name) + 1:].isdigit():
+                found.append(int(filename[len(name) + 1:]))
+        return sorted(found)
+
+    def open_segment(self):
+        if self.journal:
+            self.journal.close()
+        self.journal = open(self.segment_path(self.segment), "a", buffering=1)
+
+    def add(self, guild_id: int, user_id: int, metric: str, value, journal: bool = True):
+        progress = data["achievement_progress"][guild_id][user_id]
+        progress[metric] = progress.get(metric, 0) + value
+        deltas = self.pending.setdefault(guild_id, {}).setdefault(user_id, {})
+        if not deltas:
+            self.pending_count += 1
+        deltas[metric] = deltas.get(metric, 0) + value
+        if journal:
+            if self.journal is None:
+                self.open_segment()
+            self.journal.write(f"{guild_id} {user_id} {metric} {value!r}\n")
+        if self.pending_count >= SAVE_MAX_PENDING and not flush_lock.locked():
+            try:
+                asyncio.get_running_loop().create_task(contore_flush())
+            except RuntimeError:
+                pass
+
+    def has_pending(self) -> bool:
+        return self.pending_count > 0
+
+    def drain(self) -> int:
+        # hands every pending row to the storage backend and starts a new journal segment
+        # returns the last segment that the upcoming snapshot covers
+        for guild_id, users in self.pending.items():
+            for user_id in users:
+                contore_save("achievement_progress", guild_id, user_id)
+        self.pending = {}
+        self.pending_count = 0
+        segment = self.segment
+        data["progress_journal"]["segment"] = segment
+        contore_save("progress_journal", "segment")
+        self.segment += 1
+        if self.journal:
+            self.open_segment()
+        return segment
+
+    def commit(self, segment: int):
+        # the snapshot covering `segment` is safely on disk, older segments are no longer needed
+        for old in self.segments():
+            if old <= segment and old != self.segment:
+                os.remove(self.segment_path(old))
+
+    def replay(self):
+        # re-applies increments that were journaled but never made it into a flush
+        saved = data["progress_journal"].get("segment", -1)
+        segments = self.segments()
+        for segment in segments:
+            if segment <= saved:
+                os.remove(self.segment_path(segment))
+                continue
+            with open(self.segment_path(segment), "r") as f:
+                for line in f:
+                    parts = line.split()
+                    if len(parts) != 4: # torn write from a crash
+                        continue
+                    try:
+                        guild_id, user_id, metric, value = int(parts[0]), int(parts[1]), parts[2], parse_number(parts[3])
+                    except ValueError: # torn write from a crash
+                        continue
+                    init_achievement_progress(guild_id, user_id)
+                    self.add(guild_id, user_id, metric, value, journal=False)
+        # journaled increments stay on disk until the flush that includes them has been committed
+        self.segment = max(segments + [saved]) + 1
+
+def parse_number(value: str):
+    # values are journaled with repr, so floats can look like 1e-05 or 0.1
+    try:
+        return int(value)
+    except ValueError:
+        return float(value)
+
+progress_counters = ProgressCounters()
+
 def update_progress(guild_id: int, user_id: int, metric: str, value):
     init_achievement_progress(guild_id, user_id)
-    
-    if metric in ["messages_sent", "reactions_added", "voice_minutes"]:
-        data["achievement_progress"][guild_id][user_id][metric] += value
-    else:
-        if metric not in data["achievement_progress"][guild_id][user_id]:
-            data["achievement_progress"][guild_id][user_id][metric] = 0
-        data["achievement_progress"][guild_id][user_id][metric] += value
-    
-    contore_save()
+    progress_counters.add(guild_id, user_id, metric, value)
 
 def get_progress(guild_id: int, user_id: int, metric: str):
     init_achievement_progress(guild_id, user_id)
@@ -1099,7 +1840,12 @@ def grant_achievement(guild_id: int, user_id: int, achievement_id: str, announce
     
     if achievement_id not in data["achievements"][guild_id][user_id]:
         data["achievements"][guild_id][user_id][achievement_id] = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
-        contore_save()
+        ach_def = get_achievement_def(guild_id, achievement_id)
+        if ach_def:
+            add_points(guild_id, user_id, ach_def.get("points", 0))
+        refresh_rank(guild_id, user_id)
+        add_completion(guild_id, achievement_id, 1)
+        contore_save("achievements", guild_id, user_id)
         
         if announce_channel:
             asyncio.create_task(announce_achievement(announce_channel, guild_id, user_id, achievement_id, default_channel, send_function))
@@ -1155,46 +1901,170 @@ async def announce_achievement(channel, guild_id: int, user_id: int, achievement
             except Exception as e:
                 print(f"Failed to announce achievement: {e}")
 
+# {trigger type: (progress metric, trigger key holding the threshold)}
+THRESHOLD_TRIGGERS = {
+    "messages": ("messages_sent", "count"),
+    "reactions": ("reactions_added", "count"),
+    "voice_minutes": ("voice_minutes", "minutes")
+}
+
+class AhoCorasick:
+    # finds every occurrence of any of the patterns in a single pass over the text
+    def __init__(self, patterns: list[str]):
+        self.patterns = patterns
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for i, pattern in enumerate(patterns):
+            if not pattern:
+                continue # empty patterns are left to the caller, they'd match everywhere
+            node = 0
+            for char in pattern:
+                if char not in self.goto[node]:
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.out.append([])
+                    self.goto[node][char] = len(self.goto) - 1
+                node = self.goto[node][char]
+            self.out[node].append(i)
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for char, child in self.goto[node].items():
+                queue.append(child)
+                fail = self.fail[node]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                self.fail[child] = self.goto[fail].get(char, 0) if self.goto[fail].get(char, 0) != child else 0
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def finditer(self, text: str):
+        # yields (end index, pattern index) for every match
+        node = 0
+        for i, char in enumerate(text):
+            while node and char not in self.goto[node]:
+                node = self.fail[node]
+            node = self.goto[node].get(char, 0)
+            for pattern in self.out[node]:
+                yield i + 1, pattern
+
+    def search(self, text: str) -> set[int]:
+        return {pattern for _, pattern in self.finditer(text)}
+
+class TriggerMatcher:
+    # every message/command triggered achievement for one triggering user, compiled so a message is scanned once
+    def __init__(self, defs: list):
+        self.defs = defs
+        self.always = [] # empty content matches
+        self.exact = {} # {stripped lowercase content: [def index]}
+        self.regexes = [] # [(compiled pattern, def index)]
+        patterns = []
+        self.pattern_defs = [] # [(def index, match type)] parallel to the automaton's patterns
+        for i, ach_def in enumerate(defs):
+            trigger = ach_def["trigger"]
+            content_match = trigger.get("content_match", "")
+            match_type = trigger.get("match_type", "contains")
+            if match_type == "exact":
+                self.exact.setdefault(content_match.lower().strip(), []).append(i)
+            elif match_type == "regex":
+                try:
+                    self.regexes.append((re.compile(content_match), i))
+                except re.error:
+                    pass
+            elif match_type in ["contains", "starts_with", "ends_with"]:
+                if content_match:
+                    patterns.append(content_match.lower())
+                    self.pattern_defs.append((i, match_type))
+                else:
+                    self.always.append(i)
+        self.automaton = AhoCorasick(patterns)
+
+    def match(self, content: str) -> list:
+        lowered = content.lower()
+        matched = set(self.always)
+        matched.update(self.exact.get(lowered.strip(), ()))
+        for end, pattern in self.automaton.finditer(lowered):
+            i, match_type = self.pattern_defs[pattern]
+            if match_type == "contains" or \
+               match_type == "starts_with" and end == len(self.automaton.patterns[pattern]) or \
+               match_type == "ends_with" and end == len(lowered):
+                matched.add(i)
+        for regex, i in self.regexes:
+            if i not in matched and regex.search(content):
+                matched.add(i)
+        return [self.defs[i] for i in sorted(matched)]
+
+class AchievementIndex:
+    # lookup structures for a guild's automated achievements, rebuilt whenever its definitions change
+    def __init__(self, defs: list):
+        # {progress metric: [(threshold, achievement id)]}, sorted by threshold
+        self.thresholds = {metric: [] for metric, _ in THRESHOLD_TRIGGERS.values()}
+        # {achievement id: definition}
+        self.by_id = {ach["id"]: ach for ach in defs}
+        # {role id: [achievement ids]}
+        self.role_triggers = {}
+        message_defs = {}
+        for ach in defs:
+            if ach.get("type") != "automated" or not ach.get("trigger"):
+                continue
+            trigger = ach["trigger"]
+            if trigger.get("type") in THRESHOLD_TRIGGERS:
+                metric, key = THRESHOLD_TRIGGERS[trigger["type"]]
+                self.thresholds[metric].append((trigger.get(key, 0), ach["id"]))
+            elif trigger.get("type") == "role":
+                self.role_triggers.setdefault(trigger.get("role_id"), []).append(ach["id"])
+            elif trigger.get("type") in ["message", "command"]:
+                message_defs.setdefault(trigger.get("user_id"), []).append(ach)
+        for thresholds in self.thresholds.values():
+            thresholds.sort(key=lambda x: x[0])
+        self.threshold_values = {metric: [t for t, _ in thresholds] for metric, thresholds in self.thresholds.items()}
+        # {user id: {metric: number of thresholds already checked}}
+        self.cursors = {}
+        # {triggering user id: TriggerMatcher}, so messages from anyone else are skipped with one lookup
+        self.message_triggers = {user_id: TriggerMatcher(defs) for user_id, defs in message_defs.items()}
+
+achievement_indexes = {} # {guild_id: AchievementIndex}
+
+def get_achievement_index(guild_id: int) -> AchievementIndex:
+    if guild_id not in achievement_indexes:
+        defs = data["achievement_defs"].get(guild_id, [])
+        achievement_indexes[guild_id] = AchievementIndex(defs if isinstance(defs, list) else [])
+    return achievement_indexes[guild_id]
+
+def reindex_achievements(guild_id: int):
+    achievement_indexes.pop(guild_id, None)
+
 def check_automated_achievements(guild_id: int, user_id: int, channel: GuildChannel=None, roles: list[Role]=None):
     if guild_id not in data["achievement_defs"]:
         return
     
     init_achievement_progress(guild_id, user_id)
     progress = data["achievement_progress"][guild_id][user_id]
+    index = get_achievement_index(guild_id)
+    cursors = index.cursors.setdefault(user_id, {})
     
-    for ach_def in data["achievement_defs"][guild_id]:
-        if ach_def.get("type") != "automated":
-            continue
-        
-        if has_achievement(guild_id, user_id, ach_def["id"]):
+    earned = []
+    for metric, thresholds in index.thresholds.items():
+        if not thresholds:
             continue
-        
-        trigger = ach_def.get("trigger", {})
-        trigger_type = trigger.get("type")
-        
-        earned = False
-        
-        if trigger_type == "messages":
-            if progress["messages_sent"] >= trigger.get("count", 0):
-                earned = True
-        
-        elif trigger_type == "reactions":
-            if progress["reactions_added"] >= trigger.get("count", 0):
-                earned = True
-        
-        elif trigger_type == "voice_minutes":
-            if progress["voice_minutes"] >= trigger.get("minutes", 0):
-                earned = True
-        
-        elif trigger_type == "role":
-            if roles != None and any(r.id == trigger.get("role_id") for r in roles):
-                earned = True
-        
-        # note: message triggers are handled separately in on_message
-        
-        if earned:
-            default_channel = get_default_channel(guild_id)
-            grant_achievement(guild_id, user_id, ach_def["id"], channel or default_channel, default_channel)
+        # only thresholds between the last check and the current value can have been newly reached
+        start = cursors.get(metric, 0)
+        end = bisect_right(index.threshold_values[metric], progress.get(metric, 0))
+        if end > start:
+            earned.extend(ach_id for _, ach_id in thresholds[start:end])
+            cursors[metric] = end
+    
+    if roles != None:
+        for role in roles:
+            earned.extend(index.role_triggers.get(role.id, ()))
+    
+    # note: message triggers are handled separately in on_message
+    
+    if earned:
+        default_channel = get_default_channel(guild_id)
+        for ach_id in earned:
+            if not has_achievement(guild_id, user_id, ach_id):
+                grant_achievement(guild_id, user_id, ach_id, channel or default_channel, default_channel)
 
 def get_default_channel(guild_id: int) -> GuildChannel | None:
     default_channel = None
@@ -1213,44 +2083,18 @@ def check_message_achievements(message: Message):
     if guild_id not in data["achievement_defs"]:
         return
     
-    for ach_def in data["achievement_defs"][guild_id]:
-        if ach_def.get("type") != "automated":
-            continue
-        
-        trigger = ach_def.get("trigger", {})
-        if trigger.get("type") != "message" and (trigger.get("type") != "command" or message.interaction == None or \
+    # check if the message is from a user that triggers any achievements
+    matcher = get_achievement_index(guild_id).message_triggers.get(message.author.id)
+    if matcher is None:
+        return
+    
+    # check if message contains the required content
+    for ach_def in matcher.match(message.content):
+        trigger = ach_def["trigger"]
+        if trigger.get("type") == "command" and (message.interaction == None or \
                                                  trigger.get("command") != None and message.interaction.name != trigger.get("command")):
             continue
         
-        # check if the message is from the specified bot
-        if message.author.id != trigger.get("user_id"):
-            continue
-        
-        # check if message contains the required content
-        content_match = trigger.get("content_match", "")
-        match_type = trigger.get("match_type", "contains")
-        
-        message_content = message.content.lower()
-        content_match_lower = content_match.lower()
-        
-        matches = False
-        if match_type == "contains":
-            matches = content_match_lower in message_content
-        elif match_type == "exact":
-            matches = message_content.strip() == content_match_lower.strip()
-        elif match_type == "starts_with":
-            matches = message_content.startswith(content_match_lower)
-        elif match_type == "ends_with":
-            matches = message_content.endswith(content_match_lower)
-        elif match_type == "regex":
-            try:
-                matches = bool(re.search(content_match, message.content))
-            except re.error:
-                matches = False
-        
-        if not matches:
-            continue
-        
         default_channel = get_default_channel(guild_id)
         if trigger.get("type") == "message":
             for mentioned_user in message.mentions:
@@ -1265,7 +2109,7 @@ def check_message_achievements(message: Message):
             if trigger.get("count", None) != None:
                 update_progress(guild_id, user, "a_" + ach_def["id"], 1)
                 if get_progress(guild_id, user, "a_" + ach_def["id"]) < trigger["count"]:
-                   return
+                    continue
             if not has_achievement(guild_id, user, ach_def["id"]):
                 grant_achievement(guild_id, user, ach_def["id"], message.channel, default_channel)
 
@@ -1277,37 +2121,156 @@ def has_achievement(guild_id: int, user_id: int, achievement_id: str) -> bool:
 def get_achievement_def(guild_id: int, achievement_id: str):
     if guild_id not in data["achievement_defs"]:
         return None
-    for ach in data["achievement_defs"][guild_id]:
-        if ach["id"] == achievement_id:
-            return ach
-    return None
+    return get_achievement_index(guild_id).by_id.get(achievement_id)
 
 def get_user_achievements(guild_id: int, user_id: int):
     if guild_id not in data["achievements"] or user_id not in data["achievements"][guild_id]:
         return {}
     return data["achievements"][guild_id][user_id]
 
+achievement_points = {} # {guild_id: {user_id: total points}}, built lazily and kept up to date incrementally
+
+def get_points_totals(guild_id: int) -> dict:
+    if guild_id not in achievement_points:
+        achievement_points[guild_id] = {
+            user_id: calculate_total_points_from_achievements(achievements, guild_id)
+            for user_id, achievements in data["achievements"].get(guild_id, {}).items() if user_id != "channel"
+        }
+    return achievement_points[guild_id]
+
+def add_points(guild_id: int, user_id: int, points: int):
+    if guild_id in achievement_points:
+        totals = achievement_points[guild_id]
+        totals[user_id] = totals.get(user_id, 0) + points
+
+class AchievementRanking:
+    # a guild's users ordered by (points, achievement count), best first, kept sorted as achievements change
+    def __init__(self):
+        self.keys = [] # sorted [(-points, -count, user_id)]
+        self.entries = {} # {user_id: key}
+
+    def __len__(self):
+        return len(self.keys)
+
+    def update(self, user_id: int, points: int, count: int):
+        self.remove(user_id)
+        key = (-points, -count, user_id)
+        insort(self.keys, key)
+        self.entries[user_id] = key
+
+    def remove(self, user_id: int):
+        key = self.entries.pop(user_id, None)
+        if key is not None:
+            del self.keys[bisect_left(self.keys, key)]
+
+    def rank(self, user_id: int) -> int | None:
+        key = self.entries.get(user_id)
+        return bisect_left(self.keys, key) + 1 if key is not None else None
+
+    def page(self, start: int, count: int) -> list[tuple[int, int, int]]:
+        # [(user_id, points, achievement count)]
+        return [(user_id, -points, -achievements) for points, achievements, user_id in self.keys[start:start + count]]
+
+achievement_rankings = {} # {guild_id: AchievementRanking}
+
+def is_ranked(guild_id: int, user_id: int) -> bool:
+    # only current members of the server show up on the leaderboard
+    guild = contore.get_guild(guild_id)
+    return user_id in data["achievements"].get(guild_id, {}) and (guild is None or guild.get_member(user_id) is not None)
+
+def get_achievement_ranking(guild_id: int) -> AchievementRanking:
+    if guild_id not in achievement_rankings:
+        ranking = AchievementRanking()
+        for user_id, points in get_points_totals(guild_id).items():
+            if is_ranked(guild_id, user_id):
+                ranking.update(user_id, points, len(data["achievements"][guild_id][user_id]))
+        achievement_rankings[guild_id] = ranking
+    return achievement_rankings[guild_id]
+
+def refresh_rank(guild_id: int, user_id: int):
+    if guild_id not in achievement_rankings:
+        return
+    if is_ranked(guild_id, user_id):
+        achievement_rankings[guild_id].update(user_id, calculate_total_points(guild_id, user_id), len(get_user_achievements(guild_id, user_id)))
+    else:
+        achievement_rankings[guild_id].remove(user_id)
+
+def reset_achievement_totals(guild_id: int):
+    achievement_points.pop(guild_id, None)
+    achievement_completions.pop(guild_id, None)
+    achievement_rankings.pop(guild_id, None)
+
+def achievement_holders(guild_id: int, achievement_id: str):
+    for user_id, achievements in data["achievements"].get(guild_id, {}).items():
+        if user_id != "channel" and achievement_id in achievements:
+            yield user_id
+
 def calculate_total_points(guild_id: int, user_id: int) -> int:
-    achievements = get_user_achievements(guild_id, user_id)
-    return calculate_total_points_from_achievements(achievements, guild_id)
+    return get_points_totals(guild_id).get(user_id, 0)
 
 def calculate_total_points_from_achievements(achievements: dict, guild_id: int) -> int:
+    by_id = get_achievement_index(guild_id).by_id
     total = 0
     for ach_id in achievements.keys():
-        ach_def = get_achievement_def(guild_id, ach_id)
+        ach_def = by_id.get(ach_id)
         if ach_def:
             total += ach_def.get("points", 0)
     return total
 
+achievement_completions = {} # {guild_id: {achievement_id: number of users that have it}}
+eligible_members = {} # {guild_id: number of (non-bot) members}
+
+def count_completions(guild_id: int) -> dict:
+    counts = {}
+    for user_id, achievements in data["achievements"].get(guild_id, {}).items():
+        if user_id != "channel":
+            for achievement_id in achievements:
+                counts[achievement_id] = counts.get(achievement_id, 0) + 1
+    return counts
+
+def count_eligible_members(guild_id: int) -> int:
+    guild = contore.get_guild(guild_id)
+    if guild is None:
+        # not in the cache, fall back to everyone that has achievement data
+        return sum(1 for key in data["achievements"].get(guild_id, {}) if key != "channel")
+    return sum(1 for member in guild.members if not member.bot)
+
+def get_completions(guild_id: int) -> dict:
+    if guild_id not in achievement_completions:
+        achievement_completions[guild_id] = count_completions(guild_id)
+    return achievement_completions[guild_id]
+
+def add_completion(guild_id: int, achievement_id: str, amount: int):
+    if guild_id in achievement_completions:
+        counts = achievement_completions[guild_id]
+        counts[achievement_id] = counts.get(achievement_id, 0) + amount
+
+def update_eligible_members(member: Member, amount: int):
+    if not member.bot and member.guild.id in eligible_members:
+        eligible_members[member.guild.id] += amount
+
 def get_achievement_completion_stats(guild_id: int, achievement_id: str):
     if guild_id not in data["achievements"]:
         return 0, 0
     
-    total_users = len(data["achievements"][guild_id])
-    completed = sum(1 for key, user_achievements in data["achievements"][guild_id].items() 
-                   if key != "channel" and achievement_id in user_achievements)
+    if guild_id not in eligible_members:
+        eligible_members[guild_id] = count_eligible_members(guild_id)
     
-    return completed, total_users
+    return get_completions(guild_id).get(achievement_id, 0), eligible_members[guild_id]
+
+@tasks.loop(hours=1)
+async def reconcile_achievement_stats():
+    # the counters are only ever updated incrementally, so every now and then check them against the real data
+    for guild_id in list(achievement_completions):
+        counts = count_completions(guild_id)
+        if counts != {k: v for k, v in achievement_completions[guild_id].items() if v != 0}:
+            print(f"Achievement completion counts for guild {guild_id} drifted, correcting")
+            achievement_completions[guild_id] = counts
+    for guild_id in list(eligible_members):
+        count = count_eligible_members(guild_id)
+        if count != eligible_members[guild_id]:
+            print(f"Eligible member count for guild {guild_id} drifted ({eligible_members[guild_id]} -> {count}), correcting")
+            eligible_members[guild_id] = count
 
 def get_description(trigger: dict | None, guild_id: int | None) -> str:
     if trigger == None:
@@ -1435,7 +2398,9 @@ async def achievement_create(
     }
     
     data["achievement_defs"][ctx.guild_id].append(achievement)
-    contore_save()
+    reindex_achievements(ctx.guild_id)
+    reset_achievement_totals(ctx.guild_id) # previously kept achievements with a reused id count again
+    contore_save("achievement_defs", ctx.guild_id)
     
     desc = description
     if desc == None and type == "automated":
@@ -1578,7 +2543,8 @@ async def achievement_setautomation(
         return
     
     ach_def["trigger"] = trigger
-    contore_save()
+    reindex_achievements(ctx.guild_id)
+    contore_save("achievement_defs", ctx.guild_id)
     
     embed = Embed(
         title="Automation Set Successfully",
@@ -1641,9 +2607,15 @@ async def achievement_revoke(ctx: Interaction, user: Member, achievement_id: str
     ach_def = get_achievement_def(ctx.guild_id, achievement_id)
     
     del data["achievements"][ctx.guild_id][user.id][achievement_id]
+    get_achievement_index(ctx.guild_id).cursors.pop(user.id, None)
+    if ach_def:
+        add_points(ctx.guild_id, user.id, -ach_def.get("points", 0))
+    refresh_rank(ctx.guild_id, user.id)
+    add_completion(ctx.guild_id, achievement_id, -1)
     if "a_" + ach_def["id"] in data["achievement_progress"][ctx.guild_id][user.id]:
         del data["achievement_progress"][ctx.guild_id][user.id]["a_" + ach_def["id"]]
-    contore_save()
+    contore_save("achievements", ctx.guild_id, user.id)
+    contore_save("achievement_progress", ctx.guild_id, user.id)
     
     name = ach_def["name"] if ach_def else achievement_id
     
@@ -1657,6 +2629,7 @@ async def set_achievement_channel(ctx: Interaction, channel: GuildChannel):
     if ctx.guild_id not in data["achievements"]:
         data["achievements"][ctx.guild_id] = {}
     data["achievements"][ctx.guild_id]["channel"] = channel.id
+    contore_save("achievements", ctx.guild_id, "channel")
     await ctx.response.send_message(f"Set the achievements channel to {channel.mention}.")
 
 @achievement_commands.command(name="list", description="List all achievements in this server")
@@ -1847,7 +2820,7 @@ async def achievement_view(ctx: Interaction, user: Member = None, ephemeral: boo
         description += "\n"
     
     total_possible = sum(a["points"] for a in data["achievement_defs"][ctx.guild_id] if not a["secret"])
-    user_points = calculate_total_points_from_achievements(user_achievements, ctx.guild_id)
+    user_points = calculate_total_points(ctx.guild_id, target.id)
     # create embed
     embed = Embed(
         title=f"{target.display_name}'s Achievements",
@@ -2062,53 +3035,84 @@ async def achievement_stats(ctx: Interaction, achievement_id: str = None):
         
         await ctx.response.send_message(embed=embed)
 
+class LeaderboardMessage(View):
+    def __init__(self, guild: Guild, user_id: int, per_page: int = 10, page: int = 0, timeout: float = None):
+        super().__init__(timeout=timeout)
+        self.guild = guild
+        self.user_id = user_id
+        self.per_page = per_page
+        self.current_page = page
+        
+        self.left_button = Button(label="←", style=ButtonStyle.gray)
+        self.right_button = Button(label="→", style=ButtonStyle.gray)
+        self.left_button.callback = self.left
+        self.right_button.callback = self.right
+        self.add_item(self.left_button)
+        self.add_item(self.right_button)
+        self.update_buttons()
+
+    def page_count(self) -> int:
+        return max(1, -(-len(get_achievement_ranking(self.guild.id)) // self.per_page))
+
+    def update_buttons(self):
+        self.current_page = max(0, min(self.current_page, self.page_count() - 1))
+        self.left_button.disabled = self.current_page <= 0
+        self.right_button.disabled = self.current_page >= self.page_count() - 1
+
+    def build_embed(self) -> Embed:
+        ranking = get_achievement_ranking(self.guild.id)
+        embed = Embed(
+            title=f"Achievement Leaderboard",
+            color=0xFFD700
+        )
+        
+        medals = ["🥇", "🥈", "🥉"]
+        
+        start = self.current_page * self.per_page
+        for i, (user_id, points, earned_count) in enumerate(ranking.page(start, self.per_page), start):
+            rank = i + 1
+            medal = medals[i] if i < 3 else f"**{rank}.**"
+            member = self.guild.get_member(user_id)
+            
+            embed.add_field(
+                name=f"{medal} {member.display_name if member else user_id}",
+                value=f"Points: `{points:,}` | Achievements: `{earned_count}`",
+                inline=False
+            )
+        
+        footer = f"Page {self.current_page + 1}/{self.page_count()}"
+        rank = ranking.rank(self.user_id)
+        if rank is not None:
+            footer += f" • Your rank: #{rank:,} of {len(ranking):,}"
+        embed.set_footer(text=footer)
+        return embed
+
+    async def left(self, ctx: Interaction):
+        self.current_page -= 1
+        self.update_buttons()
+        await ctx.response.edit_message(embed=self.build_embed(), view=self)
+
+    async def right(self, ctx: Interaction):
+        self.current_page += 1
+        self.update_buttons()
+        await ctx.response.edit_message(embed=self.build_embed(), view=self)
+
+    async def on_timeout(self) -> None:
+        for item in self.children:
+            item.disabled = True
+
 @achievement_commands.command(name="leaderboard", description="View the achievement leaderboard")
 @app_commands.describe(
-    top="Number of users to show (default: 10)"
+    top="Number of users to show per page (default: 10)",
+    page="The page to start on"
 )
-async def achievement_leaderboard(ctx: Interaction, top: int = 10):
-    if ctx.guild_id not in data["achievements"]:
+async def achievement_leaderboard(ctx: Interaction, top: app_commands.Range[int, 1, 25] = 10, page: int = 1):
+    if ctx.guild_id not in data["achievements"] or len(get_achievement_ranking(ctx.guild_id)) == 0:
         await ctx.response.send_message("No one has earned any achievements yet!")
         return
     
-    await ctx.response.defer()
-
-    # calculate points for all users
-    leaderboard = []
-    for user_id, achievements in data["achievements"][ctx.guild_id].items():
-        member = ctx.guild.get_member(user_id)
-        if member:
-            points = calculate_total_points(ctx.guild_id, user_id)
-            leaderboard.append({
-                "member": member,
-                "points": points,
-                "count": len(achievements)
-            })
-    
-    if not leaderboard:
-        await ctx.followup.send("No one has earned any achievements yet!")
-        return
-    
-    leaderboard.sort(key=lambda x: (x["points"], x["count"]), reverse=True)
-    
-    embed = Embed(
-        title=f"Achievement Leaderboard",
-        color=0xFFD700
-    )
-    
-    medals = ["🥇", "🥈", "🥉"]
-    
-    for i, entry in enumerate(leaderboard[:top]):
-        rank = i + 1
-        medal = medals[i] if i < 3 else f"**{rank}.**"
-        
-        embed.add_field(
-            name=f"{medal} {entry['member'].display_name}",
-            value=f"Points: `{entry['points']:,}` | Achievements: `{entry['count']}`",
-            inline=False
-        )
-    
-    await ctx.followup.send(embed=embed)
+    view = LeaderboardMessage(ctx.guild, ctx.user.id, top, page - 1)
+    await ctx.response.send_message(embed=view.build_embed(), view=view)
 
 @achievement_commands.command(name="delete", description="Delete an achievement definition")
 @app_commands.default_permissions(manage_guild=True)
@@ -2126,6 +3130,11 @@ async def achievement_delete(ctx: Interaction, achievement_id: str, keep_progres
         await ctx.response.send_message(f"Achievement with ID `{achievement_id}` not found.", ephemeral=True)
         return
     
+    # whether or not it gets revoked, the achievement stops counting towards anyone's points
+    holders = list(achievement_holders(ctx.guild_id, achievement_id))
+    for user_id in holders:
+        add_points(ctx.guild_id, user_id, -ach_def.get("points", 0))
+    
     # remove from definitions
     data["achievement_defs"][ctx.guild_id] = [
         a for a in data["achievement_defs"][ctx.guild_id] if a["id"] != achievement_id
@@ -2146,7 +3155,16 @@ async def achievement_delete(ctx: Interaction, achievement_id: str, keep_progres
                 if "a_" + ach_def["id"] in data["achievement_progress"][ctx.guild_id][user_id]:
                     del data["achievement_progress"][ctx.guild_id][user_id]["a_" + ach_def["id"]]
     
-    contore_save()
+    for user_id in holders:
+        refresh_rank(ctx.guild_id, user_id)
+    if not keep_progress:
+        # kept achievements still count as completions, the same way count_completions sees them
+        achievement_completions.get(ctx.guild_id, {}).pop(achievement_id, None)
+    
+    reindex_achievements(ctx.guild_id)
+    contore_save("achievement_defs", ctx.guild_id)
+    contore_save("achievements", ctx.guild_id)
+    contore_save("achievement_progress", ctx.guild_id)
     
     msg = f"Deleted achievement **{ach_def['name']}**."
     if not keep_progress:
@@ -2195,13 +3213,19 @@ async def achievement_edit(
     if icon:
         ach_def["icon"] = icon
     if points is not None:
+        holders = list(achievement_holders(ctx.guild_id, achievement_id))
+        for user_id in holders:
+            add_points(ctx.guild_id, user_id, points - ach_def.get("points", 0))
         ach_def["points"] = points
+        for user_id in holders:
+            refresh_rank(ctx.guild_id, user_id)
     if rarity:
         ach_def["rarity"] = rarity
     if secret is not None:
         ach_def["secret"] = secret
     
-    contore_save()
+    reindex_achievements(ctx.guild_id)
+    contore_save("achievement_defs", ctx.guild_id)
     
     desc = ach_def.get("description")
     if desc == None and type == "automated":
@@ -2284,7 +3308,9 @@ async def achievement_bulkimport(
         else:
             skipped.append(ach["name"])
     
-    contore_save()
+    reindex_achievements(ctx.guild_id)
+    reset_achievement_totals(ctx.guild_id)
+    contore_save("achievement_defs", ctx.guild_id)
     
     msg = f"Imported {added_count} achievements from **{preset}**!"
     if skipped:
@@ -2375,13 +3401,18 @@ async def autoreact(ctx: Interaction, reaction: str, text_content: str = "", ima
         await ctx.response.send_message(f"you cannot")
         return
 
-    data["autoreactions"][ctx.guild_id] = {
+    if ctx.guild_id not in data["autoreactions"]:
+        data["autoreactions"][ctx.guild_id] = [ ]
+    elif isinstance(data["autoreactions"][ctx.guild_id], dict): # older versions stored a single autoreaction
+        data["autoreactions"][ctx.guild_id] = [data["autoreactions"][ctx.guild_id]]
+    data["autoreactions"][ctx.guild_id].append({
         "reaction": reaction,
         "text_content": text_content,
         "images": images
-    }
+    })
+    autoreaction_indexes.pop(ctx.guild_id, None)
 
-    contore_save()
+    contore_save("autoreactions", ctx.guild_id)
     await ctx.response.send_message(f"Successfully added autoreact to {ctx.guild.name}.\nReaction: {reaction}\nText content: {text_content}\nImages: {images}", ephemeral=True)
 
 @ctree.command(name="data", description="Dumps the bot's data into a JSON file and sends it.")
@@ -2403,6 +3434,7 @@ async def update(ctx: Interaction, program: Attachment):
     if ctx.user.id == contore_config["owner_id"] and program.filename.endswith(".py"):
         path = __file__.replace("\\", "/")
         await ctx.response.send_message("Updating and restarting...", ephemeral=True)
+        await contore_flush()
         await program.save(path.split("/")[-1])
         print("Opening updated file...", end="\n\n")
         if sys.platform.startswith("win"):
@@ -2456,6 +3488,7 @@ async def install(ctx: Interaction, package: str):
 async def stop(ctx: Interaction):
     if ctx.user.id == contore_config["owner_id"]:
         await ctx.response.send_message("Exiting...", ephemeral=True)
+        await contore_flush()
         await contore.close()
         sys.exit()
     else:
@@ -2468,6 +3501,7 @@ async def stop(ctx: Interaction):
 async def reboot(ctx: Interaction):
     if ctx.user.id == contore_config["owner_id"]:
         await ctx.response.send_message("starting reboot")
+        await contore_flush()
         try:
             current_pid = os.getpid()
             await ctx.channel.send(f"pid: {current_pid}")
@@ -2497,20 +3531,198 @@ async def reboot(ctx: Interaction):
     else:
         await ctx.response.send_message("nuh")
 
-def format_text(content: str):
-    return re.sub(r"\s{2,}", " ", re.sub(r" ?<@!?\d+> ?", "", content.lower()))
+MENTION_PATTERN = re.compile(r" ?<@!?\d+> ?")
+WHITESPACE_PATTERN = re.compile(r"\s{2,}")
 
-async def add_role(user: Member, *roles: Snowflake, take: bool, time: float):
-    if not take:
-        await user.add_roles(*roles)
-    else:
-        await user.remove_roles(*roles)
+def format_text(content: str):
+    return WHITESPACE_PATTERN.sub(" ", MENTION_PATTERN.sub("", content.lower()))
+
+class MessageRoleRules:
+    # a guild's role-on-message rules, compiled so a message only has to be normalized and scanned once
+    def __init__(self, guild: Guild, rules: list):
+        self.rules = [] # [(criteria, role, authorization)]
+        self.invalid = [] # rules whose role or authorized role no longer exists
+        self.exact = {} # {formatted content: [rule index]}
+        self.always = [] # sub match rules with empty content
+        patterns = []
+        self.pattern_rules = [] # rule index for each of the automaton's patterns
+        for criteria in rules:
+            if criteria.get("content", None) == None or criteria.get("type", None) == None or criteria.get("role", None) == None or criteria.get("authorization_type", None) == None:
+                continue
+            role = guild.get_role(criteria["role"])
+            # authorized users are only compared by id, they don't need to be in the member cache
+            authorization = "" if criteria["authorization_type"] not in ["Specific User", "Specific Role"] else guild.get_role(criteria.get("authorization", 0)) if criteria["authorization_type"] == "Specific Role" else Object(criteria.get("authorization", 0))
+            if role == None or authorization == None:
+                self.invalid.append(criteria)
+                continue
+            i = len(self.rules)
+            self.rules.append((criteria, role, authorization))
+            content = format_text(criteria["content"])
+            if not criteria.get("sub_match", False):
+                self.exact.setdefault(content, []).append(i)
+            elif content:
+                patterns.append(content)
+                self.pattern_rules.append(i)
+            else:
+                self.always.append(i)
+        self.automaton = AhoCorasick(patterns)
+
+    def match(self, content: str) -> list:
+        # content must already be passed through format_text
+        matched = set(self.always)
+        matched.update(self.exact.get(content, ()))
+        matched.update(self.pattern_rules[pattern] for pattern in self.automaton.search(content))
+        return [self.rules[i] for i in sorted(matched)]
+
+message_role_rules = {} # {guild_id: MessageRoleRules}
+
+def get_message_role_rules(guild: Guild) -> MessageRoleRules:
+    if guild.id not in message_role_rules:
+        compiled = MessageRoleRules(guild, data["roles_on_messages"].get(guild.id, []))
+        if compiled.invalid:
+            data["roles_on_messages"][guild.id] = [criteria for criteria in data["roles_on_messages"][guild.id] if not any(criteria is invalid for invalid in compiled.invalid)]
+            contore_save("roles_on_messages", guild.id)
+        message_role_rules[guild.id] = compiled
+    return message_role_rules[guild.id]
+
+def recompile_message_roles(guild_id: int):
+    message_role_rules.pop(guild_id, None)
+
+def is_authorized(member: Member, criteria: dict, authorization) -> bool:
+    authorization_type = criteria["authorization_type"]
+    return authorization_type == "Everyone" or \
+        authorization_type == "Alfred" and member.id == contore_config["owner_id"] or \
+        authorization_type == "Administrators" and member.guild_permissions.administrator or \
+        authorization_type == "Specific Role" and member.get_role(authorization.id) != None or \
+        authorization_type == "Specific User" and member.id == authorization.id
+
+AUTOREACTION_INDEX_MIN = 200 # rules, below this a plain scan is faster than the automaton (see --benchmark-autoreactions)
+
+class AutoreactionIndex:
+    # a guild's autoreactions grouped by the number of images they need, with one automaton per group
+    def __init__(self, rules: list):
+        self.groups = {} # {images: (automaton, [rule index per pattern], [rule indices with no text])}
+        self.scan = None # [(text, images, reaction)] instead of the automatons for small rule sets
+        self.reactions = []
+        texts = {}
+        rules = [criteria for criteria in rules if criteria.get("reaction", None) != None and criteria.get("text_content", None) != None and criteria.get("images", None) != None]
+        if len(rules) < AUTOREACTION_INDEX_MIN:
+            self.scan = [(criteria["text_content"], criteria["images"], criteria["reaction"]) for criteria in rules]
+            self.reactions = [criteria["reaction"] for criteria in rules]
+            return
+        for criteria in rules:
+            texts.setdefault(criteria["images"], []).append((criteria["text_content"], len(self.reactions)))
+            self.reactions.append(criteria["reaction"])
+        for images, entries in texts.items():
+            patterns = [text for text, _ in entries if text]
+            self.groups[images] = (AhoCorasick(patterns), [i for text, i in entries if text], [i for text, i in entries if not text])
+
+    def __bool__(self):
+        return bool(self.reactions)
+
+    def match(self, content: str, images: int) -> list:
+        if self.scan is not None:
+            return [reaction for text, rule_images, reaction in self.scan if rule_images == images and text in content]
+        if images not in self.groups:
+            return []
+        automaton, pattern_rules, always = self.groups[images]
+        matched = set(always)
+        matched.update(pattern_rules[pattern] for pattern in automaton.search(content))
+        return [self.reactions[i] for i in sorted(matched)]
+
+autoreaction_indexes = {} # {guild_id: AutoreactionIndex}
+
+def get_autoreaction_index(guild_id: int) -> AutoreactionIndex:
+    if guild_id not in autoreaction_indexes:
+        rules = data["autoreactions"].get(guild_id, [])
+        autoreaction_indexes[guild_id] = AutoreactionIndex([rules] if isinstance(rules, dict) else rules)
+    return autoreaction_indexes[guild_id]
+
+def benchmark_autoreactions(messages: int = 1000):
+    # python contore.py --benchmark-autoreactions [messages]
+    # compares the per-message cost of matching autoreactions with a plain scan and with AutoreactionIndex
+    words = ["".join(random.choices("abcdefghijklmnopqrstuvwxyz", k=random.randint(3, 8))) for _ in range(2000)]
+    samples = [(" ".join(random.choices(words, k=random.randint(5, 40))), random.randint(0, 2)) for _ in range(messages)]
+
+    def linear(rules: list, content: str, images: int):
+        # the old approach, kept here as the baseline
+        return [criteria["reaction"] for criteria in rules if criteria["text_content"] in content and images == criteria["images"]]
+
+    for rule_count in [10, 50, 100, 1000, 5000]:
+        rules = [{"reaction": "👍", "text_content": random.choice(words), "images": random.randint(0, 2)} for _ in range(rule_count)]
+        start = time.perf_counter()
+        for content, images in samples:
+            linear(rules, content, images)
+        linear_time = (time.perf_counter() - start) / messages
+        start = time.perf_counter()
+        index = AutoreactionIndex(rules)
+        build_time = time.perf_counter() - start
+        start = time.perf_counter()
+        for content, images in samples:
+            index.match(content, images)
+        index_time = (time.perf_counter() - start) / messages
+        print(f"{rule_count:>5} rules: linear {linear_time * 1e6:9.1f}µs, {'scanned' if index.scan is not None else 'indexed'} {index_time * 1e6:7.1f}µs per message (built in {build_time * 1e3:.1f}ms)")
+
+ROLE_WORKERS = 8
+ROLE_GUILD_CONCURRENCY = 2 # role edits share a rate limit bucket per guild, so don't hammer a single guild
+
+role_queue = asyncio.Queue() # (guild_id, member_id) with pending changes
+pending_role_changes = {} # {(guild_id, member_id): {role_id: (role, give)}}
+role_guild_limits = {} # {guild_id: asyncio.Semaphore}
+role_member_locks = {} # {(guild_id, member_id): asyncio.Lock}, so one member's changes are applied in order
+role_workers = []
+
+def add_role(user: Member, *roles: Snowflake, take: bool, time: float):
+    queue_role_change(user, roles, not take)
     if time > 0:
-        await asyncio.sleep(time)
-        if not take:
-            await user.remove_roles(*roles)
-        else:
-            await user.add_roles(*roles)
+        call_at(datetime.now() + timedelta(seconds=time), revert_role_change, user.guild.id, user.id, roles, take)
+
+def queue_role_change(user: Member, roles, give: bool):
+    key = (user.guild.id, user.id)
+    if key not in pending_role_changes:
+        pending_role_changes[key] = {}
+        role_queue.put_nowait(key)
+    for role in roles:
+        pending_role_changes[key][role.id] = (role, give) # a later change to the same role overrides the earlier one
+
+async def revert_role_change(guild_id: int, user_id: int, roles, give: bool):
+    guild = contore.get_guild(guild_id)
+    user = guild.get_member(user_id) if guild else None
+    if user:
+        queue_role_change(user, roles, give)
+
+async def role_worker():
+    while True:
+        key = await role_queue.get()
+        lock = role_member_locks.setdefault(key, asyncio.Lock())
+        try:
+            async with lock:
+                changes = pending_role_changes.pop(key, {})
+                guild = contore.get_guild(key[0])
+                user = guild.get_member(key[1]) if guild else None
+                if not user or not changes:
+                    continue
+                # only the roles that actually change are sent, so roles changed by anyone else in the meantime are left alone
+                current = {role.id for role in user.roles}
+                to_add = [role for role_id, (role, give) in changes.items() if give and role_id not in current]
+                to_remove = [role for role_id, (role, give) in changes.items() if not give and role_id in current]
+                if key[0] not in role_guild_limits:
+                    role_guild_limits[key[0]] = asyncio.Semaphore(ROLE_GUILD_CONCURRENCY)
+                async with role_guild_limits[key[0]]:
+                    if to_add:
+                        await user.add_roles(*to_add)
+                    if to_remove:
+                        await user.remove_roles(*to_remove)
+        except Exception as e:
+            print(f"Error applying role changes for {key[1]} in {key[0]}: {e}")
+        finally:
+            if key not in pending_role_changes and not lock.locked():
+                role_member_locks.pop(key, None)
+            role_queue.task_done()
+
+def start_role_workers():
+    if not role_workers:
+        role_workers.extend(asyncio.get_running_loop().create_task(role_worker()) for _ in range(ROLE_WORKERS))
 
 @contore.event
 async def on_message(message: Message):
@@ -2522,48 +3734,28 @@ async def on_message(message: Message):
         return
     if message.guild.id not in data["roles_on_messages"] and message.guild.id not in data["autoreactions"] and message.guild.id not in data["achievement_defs"]:
         return
-    for i, criteria in enumerate(data["roles_on_messages"].get(message.guild.id, {})):
-        if criteria.get("content", None) == None or criteria.get("type", None) == None or criteria.get("role", None) == None or criteria.get("authorization_type", None) == None:
-            continue
-        role = message.guild.get_role(criteria["role"])
-        authorization = "" if criteria["authorization_type"] not in ["Specified User", "Specified Role"] else message.guild.get_role(criteria.get("authorization", 0)) if criteria["authorization_type"] == "Specified Role" else message.guild.get_member(criteria.get("authorization", 0))
-        if role == None or authorization == None:
-            try:
-                data["roles_on_messages"][message.guild.id].remove(criteria)
-                contore_save()
-            except ValueError:
-                try:
-                    data["roles_on_messages"][message.guild.id].pop(i)
-                    contore_save()
-                except IndexError:
-                    pass
-            continue
-        if ((criteria.get("sub_match", False) and format_text(criteria["content"]) in format_text(message.content)) or format_text(criteria["content"]) == format_text(message.content)) and ((criteria["authorization_type"] == "Alfred" and message.author.id == contore_config["owner_id"]) or (criteria["authorization_type"] == "Administrators" and message.author.guild_permissions.administrator) or (criteria["authorization_type"] == "Specific Role" and message.author.get_role(criteria.get("authorization", 0)) != None) or (criteria["authorization_type"] == "Specific User" and user.id == criteria.get("authorization", 0)) or criteria["authorization_type"] == "Everyone"):
+    content = format_text(message.content)
+    for criteria, role, authorization in get_message_role_rules(message.guild).match(content):
+        if is_authorized(message.author, criteria, authorization):
             if criteria["type"] == "Self":
-                await add_role(message.author, role, take=criteria.get("take", False), time=criteria.get("time_limit", -1))
-            elif criteria["type"] == "Specific User" and message.guild.get_member(criteria.get("type_user", 0)) != None:
-                await add_role(message.guild.get_member(criteria.get("type_user", 0)), role, take=criteria.get("take", False), time=criteria.get("time_limit", -1))
+                targets = [message.author]
+            elif criteria["type"] == "Specific User":
+                target = message.guild.get_member(criteria.get("type_user", 0))
+                targets = [target] if target else []
+            elif message.mention_everyone:
+                targets = message.guild.members
             else:
-                if message.mention_everyone:
-                    for member in message.guild.members:
-                        await add_role(member, role, take=criteria.get("take", False), time=criteria.get("time_limit", -1))
-                else:
-                    for role in message.role_mentions:
-                        for member in role.members:
-                            await add_role(member, role, take=criteria.get("take", False), time=criteria.get("time_limit", -1))
-                    for user in message.mentions:
-                        if isinstance(user, Member):
-                            await add_role(user, role, take=criteria.get("take", False), time=criteria.get("time_limit", -1))
-
-    for criteria in data["autoreactions"].get(message.guild.id, []):
-        if criteria.get("reaction", None) == None or criteria.get("text_content", None) == None or criteria.get("images", None) == None:
-            continue
-        images = 0
-        for att in message.attachments:
-            if att.content_type.startswith("image/"):
-                images += 1
-        if criteria["text_content"] in message.content and images == criteria["images"]:
-            await message.add_reaction(criteria["reaction"])
+                targets = {member.id: member for mentioned_role in message.role_mentions for member in mentioned_role.members}
+                targets.update({user.id: user for user in message.mentions if isinstance(user, Member)})
+                targets = targets.values()
+            for member in targets:
+                add_role(member, role, take=criteria.get("take", False), time=criteria.get("time_limit", -1))
+
+    autoreactions = get_autoreaction_index(message.guild.id)
+    if autoreactions:
+        images = sum(1 for att in message.attachments if att.content_type and att.content_type.startswith("image/"))
+        for reaction in autoreactions.match(message.content, images):
+            await message.add_reaction(reaction)
     
     # track message for achievements
     update_progress(message.guild.id, message.author.id, "messages_sent", 1)
@@ -2583,29 +3775,87 @@ async def on_member_update(before: Member, after: Member):
         if new_roles:
             check_automated_achievements(after.guild.id, after.id, roles=new_roles)
 
+VOICE_CREDIT_INTERVAL = 5 # minutes between crediting everyone who's still in a voice channel
+VOICE_MAX_GAP = 15 # minutes, the most a single credit can be worth (e.g. for time spent in voice while the bot was offline)
+
+def credit_voice(guild_id: int, user_id: int, now: float):
+    # credits the minutes since the session was last credited and moves its checkpoint up to now
+    sessions = data["voice_sessions"][guild_id]
+    minutes = min(max(now - sessions[user_id], 0) / 60, VOICE_MAX_GAP)
+    sessions[user_id] = now
+    if minutes > 0:
+        update_progress(guild_id, user_id, "voice_minutes", minutes)
+        check_automated_achievements(guild_id, user_id)
+
+def open_voice_session(guild_id: int, user_id: int, now: float):
+    data["voice_sessions"].setdefault(guild_id, {})[user_id] = now
+    contore_save("voice_sessions", guild_id)
+
+def close_voice_session(guild_id: int, user_id: int, now: float):
+    sessions = data["voice_sessions"].get(guild_id, {})
+    if user_id in sessions:
+        credit_voice(guild_id, user_id, now)
+        del sessions[user_id]
+        if not sessions:
+            del data["voice_sessions"][guild_id]
+        contore_save("voice_sessions", guild_id)
+
+def reconcile_voice_sessions():
+    # voice states can change while the bot is offline, so the saved sessions are checked against who's actually in voice now
+    now = time.time()
+    for guild_id in list(data["voice_sessions"]):
+        if contore.get_guild(guild_id) is None:
+            del data["voice_sessions"][guild_id]
+            contore_save("voice_sessions", guild_id)
+    for guild in contore.guilds:
+        in_voice = {member_id for channel in chain(guild.voice_channels, guild.stage_channels) for member_id in channel.voice_states}
+        for user_id in set(data["voice_sessions"].get(guild.id, {})) - in_voice:
+            close_voice_session(guild.id, user_id, now)
+        for user_id in in_voice:
+            if user_id in data["voice_sessions"].get(guild.id, {}):
+                credit_voice(guild.id, user_id, now) # capped, nobody knows how much of the downtime they spent in voice
+                contore_save("voice_sessions", guild.id)
+            else:
+                open_voice_session(guild.id, user_id, now)
+
+@tasks.loop(minutes=VOICE_CREDIT_INTERVAL)
+async def credit_voice_sessions():
+    # credits long sessions as they go, so voice_minutes achievements don't wait for the disconnect
+    now = time.time()
+    for guild_id, sessions in data["voice_sessions"].items():
+        for user_id in list(sessions):
+            credit_voice(guild_id, user_id, now)
+        contore_save("voice_sessions", guild_id)
+
 @contore.event
 async def on_voice_state_update(member: Member, before, after):
-    guild_id = member.guild.id
-    user_id = member.id
-    
-    if guild_id not in voice_tracking:
-        voice_tracking[guild_id] = {}
-    
-    # user joined a voice channel
-    if before.channel is None and after.channel is not None:
-        voice_tracking[guild_id][user_id] = datetime.now()
-    
-    # user left a voice channel
-    elif before.channel is not None and after.channel is None:
-        if user_id in voice_tracking[guild_id]:
-            join_time = voice_tracking[guild_id][user_id]
-            duration = (datetime.now() - join_time).total_seconds() / 60 # minutes
-            update_progress(guild_id, user_id, "voice_minutes", duration)
-            check_automated_achievements(guild_id, user_id)
-            del voice_tracking[guild_id][user_id]
+    now = time.time()
+    if after.channel is None:
+        close_voice_session(member.guild.id, member.id, now)
+    elif member.id not in data["voice_sessions"].get(member.guild.id, {}):
+        open_voice_session(member.guild.id, member.id, now)
+    # moving between channels (or muting, deafening, streaming...) just carries on the same session
+
+@contore.event
+async def on_raw_message_edit(payload):
+    uncache_quote_render(payload.message_id)
+
+@contore.event
+async def on_raw_message_delete(payload):
+    uncache_quote_render(payload.message_id)
+
+@contore.event
+async def on_guild_role_update(before: Role, after: Role):
+    recompile_message_roles(after.guild.id)
+
+@contore.event
+async def on_guild_role_delete(role: Role):
+    recompile_message_roles(role.guild.id)
 
 @contore.event
 async def on_member_join(member: Member):
+    refresh_rank(member.guild.id, member.id)
+    update_eligible_members(member, 1)
     if member.guild.id not in data["auto_roles"]:
         return
     if member.id not in data["auto_roles"][member.guild.id]:
@@ -2618,89 +3868,195 @@ async def on_member_join(member: Member):
             if role_id != None:
                 await member.add_roles(member.guild.get_role(role_id))
 
-birthdays_sent = []
+scheduled_events = [] # heap of (when, sequence, callback, args)
+scheduler_sequence = count()
+scheduler_wakeup = asyncio.Event()
+scheduler_task = None
+
+def call_at(when: datetime, callback, *args):
+    sequence = next(scheduler_sequence)
+    heappush(scheduled_events, (when, sequence, callback, args))
+    if scheduled_events[0][1] == sequence:
+        scheduler_wakeup.set() # new earliest event, so the scheduler needs to recompute how long to sleep
+
+async def run_scheduler():
+    while True:
+        scheduler_wakeup.clear()
+        while scheduled_events and scheduled_events[0][0] <= datetime.now():
+            _, _, callback, args = heappop(scheduled_events)
+            try:
+                await callback(*args)
+            except Exception as e:
+                print(f"Error in scheduled event {callback.__name__}: {e}")
+        # wake up at least once an hour in case the system clock jumps
+        timeout = min((scheduled_events[0][0] - datetime.now()).total_seconds(), 3600) if scheduled_events else 3600
+        try:
+            await asyncio.wait_for(scheduler_wakeup.wait(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            pass
 
-@tasks.loop(seconds=10)
-async def check_scheduled_roles():
-    now = datetime.now()
+def start_scheduler():
+    global scheduler_task
+    if scheduler_task is not None:
+        return
+    scheduler_task = asyncio.get_running_loop().create_task(run_scheduler())
+    for guild_id, schedules in list(data["scheduled_roles"].items()):
+        for schedule in list(schedules): # plan_schedule removes schedules that have run their course
+            plan_schedule(guild_id, schedule)
+    call_at(datetime.now(), birthday_rollover)
+
+def parse_timestamp(value) -> datetime:
+    return value if isinstance(value, datetime) else datetime.strptime(value, "%Y-%m-%d %H:%M:%S.%f")
+
+def clamp_date(year: int, month: int, day: int) -> datetime:
+    # e.g. a monthly role on the 31st fires on the 30th in months that don't have a 31st
+    return datetime(year, month, min(day, calendar.monthrange(year, month)[1]))
+
+def add_months(year: int, month: int, months: int):
+    year, month = divmod(year * 12 + month - 1 + months, 12)
+    return year, month + 1
+
+def schedule_period(schedule: dict, after: datetime):
+    # the first (start, end) window in which the role should be assigned that ends after `after`, or None if there are no more
+    kind = schedule["type"]
+    if kind == "one-time":
+        start = datetime(*schedule["target_date"])
+        periods = [(start, start + timedelta(days=1))]
+    elif kind == "yearly-month":
+        year, month = schedule["target_month"]
+        periods = [(datetime(year, month, 1), datetime(*add_months(year, month, 1), 1))]
+    elif kind == "yearly":
+        periods = [(datetime(schedule["target_year"], 1, 1), datetime(schedule["target_year"] + 1, 1, 1))]
+    elif kind == "annual":
+        month, day = map(int, schedule["date_pattern"].split("-"))
+        periods = ((start, start + timedelta(days=1)) for start in (clamp_date(year, month, day) for year in range(after.year - 1, after.year + 2)))
+    elif kind == "monthly":
+        month = int(schedule["date_pattern"])
+        periods = ((datetime(year, month, 1), datetime(*add_months(year, month, 1), 1)) for year in range(after.year - 1, after.year + 2))
+    elif kind == "monthly-day":
+        day = int(schedule["date_pattern"])
+        periods = ((start, start + timedelta(days=1)) for start in (clamp_date(*add_months(after.year, after.month, offset), day) for offset in range(-1, 2)))
+    else:
+        return None
+    return next((period for period in periods if period[1] > after), None)
 
-    for guild_id, schedules in data["scheduled_roles"].items():
-        guild = contore.get_guild(guild_id)
+def schedule_is_active(guild_id: int, schedule: dict) -> bool:
+    return any(s is schedule for s in data["scheduled_roles"].get(guild_id, []))
 
-        for schedule in schedules[:]:
-            role = guild.get_role(schedule["role_id"])
-            user = guild.get_member(schedule["user_id"])
+def remove_schedule(guild_id: int, schedule: dict):
+    schedules = data["scheduled_roles"].get(guild_id, [])
+    for i, s in enumerate(schedules):
+        if s is schedule:
+            del schedules[i]
+            contore_save("scheduled_roles", guild_id)
+            return
 
-            if not role or not user:
-                schedules.remove(schedule)
-                contore_save()
-                continue
+def plan_schedule(guild_id: int, schedule: dict):
+    now = datetime.now()
+    if schedule.get("assigned_at"):
+        if not schedule["duration"]:
+            return # kept forever
+        call_at(parse_timestamp(schedule["assigned_at"]) + timedelta(hours=schedule["duration"] or 0), expire_schedule, guild_id, schedule)
+        return
+    after = now
+    try:
+        if schedule.get("last_assigned"):
+            # don't hand the role out twice in the same period
+            last_period = schedule_period(schedule, parse_timestamp(schedule["last_assigned"]))
+            if last_period:
+                after = max(after, last_period[1])
+        period = schedule_period(schedule, after)
+    except ValueError as e:
+        # a bad stored pattern (e.g. from before patterns were validated) mustn't stop everything else from being planned
+        print(f"Dropping scheduled role with invalid pattern {schedule.get('date_pattern')!r} in {guild_id}: {e}")
+        period = None
+    if period is None:
+        remove_schedule(guild_id, schedule)
+        return
+    call_at(max(period[0], now), assign_schedule, guild_id, schedule)
 
-            apply_role = False
-            if schedule["type"] == "one-time" and "target_date" in schedule:
-                if now.year == schedule["target_date"][0] and now.month == schedule["target_date"][1] and now.day == schedule["target_date"][2]:
-                    apply_role = True
-
-            elif schedule["type"] == "yearly-month" and "target_month" in schedule:
-                if now.year == schedule["target_month"][0] and now.month == schedule["target_month"][1]:
-                    apply_role = True
-
-            elif schedule["type"] == "yearly" and "target_year" in schedule:
-                if now.year == schedule["target_year"]:
-                    apply_role = True
-
-            elif schedule["type"] == "annual":
-                month, day = map(int, schedule["date_pattern"].split("-"))
-                if now.month == month and now.day == day:
-                    apply_role = True
-
-            elif schedule["type"] == "monthly":
-                if now.month == int(schedule["date_pattern"]):
-                    apply_role = True
-
-            elif schedule["type"] == "monthly-day":
-                if now.day == int(schedule["date_pattern"]):
-                    apply_role = True
-
-            if apply_role and "assigned_at" not in schedule:
-                await user.add_roles(role)
-                schedule["assigned_at"] = now
-                contore_save()
-
-            if schedule.get("assigned_at") and schedule["duration"]:
-                elapsed_time = (now - schedule["assigned_at"]).total_seconds() / 3600
-                if elapsed_time >= schedule["duration"]:
-                    await user.remove_roles(role)
-                    if schedule["type"] in ["one-time", "yearly", "yearly-month"]:
-                        schedules.remove(schedule)
-                        contore_save()
-    
-    for guild in contore.guilds:
-        birthday_role_id, birthday_channel_id = data["birthday_data"].get(guild.id, (-1, -1))
-        if birthday_role_id != -1 or birthday_channel_id != -1:
-            birthday_role = guild.get_role(birthday_role_id)
-            birthday_channel = guild.get_channel_or_thread(birthday_channel_id)
-            for user_id, birthday_info in data["birthdays"].items():
-                member = guild.get_member(user_id)
-                if not member:
-                    continue
-                birth_date = datetime.strptime(birthday_info if not birthday_info.startswith("0000-") else birthday_info[5:], "%Y-%m-%d" if not birthday_info.startswith("0000-") else "%m-%d")
-                is_today = birth_date.day == now.day and birth_date.month == now.month
+SCHEDULE_RETRY_DELAYS = [30, 60, 300, 900, 3600] # seconds to wait before trying again while a guild isn't available
 
-                if birthday_role:
-                    has_role = birthday_role in member.roles
+def resolve_schedule(guild_id: int, schedule: dict, callback, attempt: int):
+    guild = contore.get_guild(guild_id)
+    if guild is None or guild.unavailable or not guild.chunked:
+        # not cached yet (startup, gateway outage), so try again later instead of dropping the schedule
+        delay = SCHEDULE_RETRY_DELAYS[min(attempt, len(SCHEDULE_RETRY_DELAYS) - 1)]
+        call_at(datetime.now() + timedelta(seconds=delay), callback, guild_id, schedule, attempt + 1)
+        return None, None
+    role = guild.get_role(schedule["role_id"])
+    user = guild.get_member(schedule["user_id"])
+    if not role or not user:
+        remove_schedule(guild_id, schedule)
+        return None, None
+    return role, user
+
+async def assign_schedule(guild_id: int, schedule: dict, attempt: int = 0):
+    if not schedule_is_active(guild_id, schedule):
+        return
+    role, user = resolve_schedule(guild_id, schedule, assign_schedule, attempt)
+    if not role:
+        return
+    await user.add_roles(role)
+    schedule["assigned_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")
+    contore_save("scheduled_roles", guild_id)
+    plan_schedule(guild_id, schedule)
 
-                    if is_today and not has_role:
-                        await member.add_roles(birthday_role)
-                    elif not is_today and has_role:
-                        await member.remove_roles(birthday_role)
+async def expire_schedule(guild_id: int, schedule: dict, attempt: int = 0):
+    if not schedule_is_active(guild_id, schedule):
+        return
+    role, user = resolve_schedule(guild_id, schedule, expire_schedule, attempt)
+    if not role:
+        return
+    await user.remove_roles(role)
+    if schedule["type"] in ["one-time", "yearly", "yearly-month"]:
+        remove_schedule(guild_id, schedule)
+        return
+    schedule["last_assigned"] = schedule.pop("assigned_at")
+    contore_save("scheduled_roles", guild_id)
+    plan_schedule(guild_id, schedule)
+
+async def birthday_rollover():
+    await celebrate_birthdays()
+    call_at(datetime.combine(datetime.now().date() + timedelta(days=1), datetime.min.time()), birthday_rollover)
+
+async def celebrate_birthdays():
+    today = datetime.now().date()
+    today_key = today.isoformat()
+    todays_users = birthdays_on(today)
+    for guild_id in set(data["birthday_data"]) | set(data["birthdays_sent"]):
+        guild = contore.get_guild(guild_id)
+        if guild is None:
+            continue
+        birthday_role_id, birthday_channel_id = data["birthday_data"].get(guild_id, (-1, -1))
+        birthday_role = guild.get_role(birthday_role_id)
+        celebrated = data["birthdays_sent"].setdefault(guild_id, {})
 
-                if birthday_channel:
-                    if is_today and not (user_id, birthday_channel_id) in birthdays_sent:
-                        await birthday_channel.send(f"Happy birthday, {member.mention}! 🎂🎉")
-                        birthdays_sent.append((user_id, birthday_channel_id))
-                    elif not is_today and (user_id, birthday_channel_id) in birthdays_sent:
-                        birthdays_sent.remove((user_id, birthday_channel_id))
+        # wrap up birthdays that are over (or were forgotten)
+        for user_id, date in list(celebrated.items()):
+            if date == today_key and user_id in todays_users:
+                continue
+            del celebrated[user_id]
+            contore_save("birthdays_sent", guild_id, user_id)
+            member = guild.get_member(user_id)
+            if birthday_role and member and birthday_role in member.roles:
+                await member.remove_roles(birthday_role)
+
+        if birthday_role_id == -1 and birthday_channel_id == -1:
+            continue
+        birthday_channel = guild.get_channel_or_thread(birthday_channel_id)
+        for user_id in todays_users:
+            if user_id in celebrated:
+                continue
+            member = guild.get_member(user_id)
+            if not member:
+                continue
+            if birthday_role and birthday_role not in member.roles:
+                await member.add_roles(birthday_role)
+            if birthday_channel:
+                await birthday_channel.send(f"Happy birthday, {member.mention}! 🎂🎉")
+            celebrated[user_id] = today_key
+            contore_save("birthdays_sent", guild_id, user_id)
 
 def format_message(template: str, member: Member, inviter: Member=None, invite=None):
     replacements = {
@@ -2767,7 +4123,7 @@ async def leave_message(ctx: Interaction, message: str = None, channel: Union[Gu
         message = message.replace("\\n", "\n")
     data["leave_msgs"][ctx.guild_id]["msg"] = message
     data["leave_msgs"][ctx.guild_id]["chan"] = channel.id if channel else None
-    contore_save()
+    contore_save("leave_msgs", ctx.guild_id)
     await ctx.response.send_message("Leave message removed." if message is None or channel is None else f"Leave messages will be sent in: {channel.mention}\nLeave message set to:\n```\n{message}\n```", ephemeral=True)
 
 @leave_commands.command(name="preview", description="Preview the configured leave message")
@@ -2781,6 +4137,8 @@ async def preview_leave(ctx: Interaction):
 
 @contore.event
 async def on_member_remove(member: Member):
+    refresh_rank(member.guild.id, member.id)
+    update_eligible_members(member, -1)
     leave = data["leave_msgs"].get(member.guild.id, {"msg": None, "chan": None})
     if leave["msg"] is not None and leave["chan"] is not None:
         channel = member.guild.get_channel_or_thread(leave["chan"])
@@ -2788,72 +4146,273 @@ async def on_member_remove(member: Member):
             formatted = format_message(leave["msg"], member)
             await channel.send(formatted)
 
-async def format_embed(message: Message, prefix="", color=Color(0x2B2D31)):
-    filenames = []
-    embeds = []
-    embed = Embed(description=message.system_content, color=color, timestamp=message.created_at)
-    embed.set_author(name=f"{prefix}{message.author.display_name}{' 🤖' if message.author.bot or message.author.system else ''}", url=message.jump_url, icon_url=message.author.avatar.url)
-    if message.attachments:
-        for attachment in message.attachments:
-            if attachment.content_type.startswith('image/'):
-                if getattr(embed, "_image", None) is None:
-                    embed.set_image(url=attachment.url)
-                else:
-                    embeds.append(Embed().set_image(url=attachment.url))
-    if message.stickers:
-        for sticker in message.stickers:
-            if sticker.format is StickerFormatType.apng:
-                embed.description += f"\n*Sent a sticker: {sticker.name}*"
-            else:
-                if getattr(embed, "_image", None) is None:
-                    embed.set_image(url=sticker.url)
-                else:
-                    embeds.append(Embed().set_image(url=sticker.url))
-    embeds.append(embed)
-    embeds.extend(message.embeds)
-    return embeds, filenames
-
-async def copy_attachments(message: Message):
-    attachments = []
-    if message.attachments:
-        for attachment in message.attachments:
-            if not attachment.content_type.startswith('image/'):
-                async with attachment_retriever as h:
-                    response = await h.get(attachment.url)
-                    if response.status_code == 200:
-                        attachment_bytes = response.read()
-                        file = File(BytesIO(attachment_bytes), filename=attachment.filename, spoiler=attachment.is_spoiler(), description=attachment.description)
-                        attachments.append(file)
-    return attachments
-
-async def format_message_into_embed(message: Message):
-    embeds, attachments = [], []
-    if message.reference:
+def snapshot_message(message: Message) -> dict:
+    # everything needed to draw a quote without fetching the message again
+    images = [attachment.url for attachment in message.attachments if attachment_transfer.is_image(attachment)]
+    stickers = [] # stickers that can't be shown as images
+    for sticker in message.stickers:
+        if sticker.format is StickerFormatType.apng:
+            stickers.append(sticker.name)
+        else:
+            images.append(sticker.url)
+    return {
+        "author": message.author.display_name,
+        "avatar": message.author.display_avatar.url,
+        "bot": message.author.bot or message.author.system,
+        "content": message.system_content,
+        "url": message.jump_url,
+        "created_at": message.created_at.isoformat(),
+        "edited_at": message.edited_at.isoformat() if message.edited_at else None,
+        "images": images,
+        "stickers": stickers,
+        "files": [attachment_transfer.attachment_entry(attachment) for attachment in message.attachments if not attachment_transfer.is_image(attachment)],
+        "embeds": [embed.to_dict() for embed in message.embeds]
+    }
+
+async def snapshot_quote(message: Message) -> dict:
+    snapshot = snapshot_message(message)
+    snapshot["reply"] = None
+    if message.reference and message.reference.message_id:
+        ref_message = message.reference.resolved if isinstance(message.reference.resolved, Message) else None
         try:
-            ref_message = await message.channel.fetch_message(message.reference.message_id)
-            ref_embeds, _ = await format_embed(ref_message, prefix="Replying to ")
-            embeds.extend(ref_embeds)
-            attachments.extend(await copy_attachments(ref_message))
+            ref_message = ref_message or await message.channel.fetch_message(message.reference.message_id)
+            snapshot["reply"] = snapshot_message(ref_message)
         except NotFound:
             pass
-    orig_embeds, _ = await format_embed(message, color=Color(0xEEE2A0))
-    embeds.extend(orig_embeds)
-    attachments.extend(await copy_attachments(message))
+    snapshot["taken_at"] = time.time()
+    return snapshot
+
+def format_embed(snapshot: dict, prefix="", color=Color(0x2B2D31)):
+    embeds = []
+    embed = Embed(description=snapshot["content"], color=color, timestamp=datetime.fromisoformat(snapshot["created_at"]))
+    embed.set_author(name=f"{prefix}{snapshot['author']}{' 🤖' if snapshot['bot'] else ''}", url=None if snapshot.get("deleted") else snapshot["url"], icon_url=snapshot["avatar"])
+    for url in snapshot["images"]:
+        if getattr(embed, "_image", None) is None:
+            embed.set_image(url=url)
+        else:
+            embeds.append(Embed().set_image(url=url))
+    for name in snapshot["stickers"]:
+        embed.description += f"\n*Sent a sticker: {name}*"
+    if snapshot.get("deleted"):
+        embed.description += "\n*The original message has been deleted.*"
+    embeds.append(embed)
+    embeds.extend(Embed.from_dict(e) for e in snapshot["embeds"])
+    return embeds
+
+def format_snapshot(snapshot: dict):
+    embeds = format_embed(snapshot["reply"], prefix="Replying to ") if snapshot.get("reply") else []
+    embeds.extend(format_embed(snapshot, color=Color(0xEEE2A0)))
+    return embeds
+
+QUOTE_CACHE_SIZE = 256 # rendered quotes kept in memory
+QUOTE_CACHE_TTL = 6 * 60 * 60 # seconds, attachment urls in the embeds expire eventually
+QUOTE_PREFETCH = 3 # pages to render ahead of and behind the current one
+QUOTE_SNAPSHOT_REFRESH = 20 * 60 * 60 # seconds, discord's signed cdn urls (attachments, images) expire after about a day
+
+quote_render_cache = OrderedDict() # {message id: (rendered at, snapshot taken at, embeds, attachments)}, least recently used first
+quote_renders = {} # {message id: task} for renders that are in progress
+
+def cache_quote_render(message_id: int, taken_at: float, embeds: list, attachments: list):
+    quote_render_cache[message_id] = (time.time(), taken_at, embeds, attachments)
+    quote_render_cache.move_to_end(message_id)
+    while len(quote_render_cache) > QUOTE_CACHE_SIZE:
+        quote_render_cache.popitem(last=False)
+
+def uncache_quote_render(message_id: int):
+    quote_render_cache.pop(message_id, None)
+
+def cached_quote_render(message_id: int, taken_at: float):
+    # renders of an older snapshot don't count
+    entry = quote_render_cache.get(message_id)
+    if entry is None or time.time() - entry[0] > QUOTE_CACHE_TTL or entry[1] != taken_at:
+        return None
+    quote_render_cache.move_to_end(message_id)
+    return entry[2], entry[3]
+
+async def render_snapshot(message_id: int, snapshot: dict):
+    # (embeds, non-image attachments), images are already shown in the embeds
+    cached = cached_quote_render(message_id, snapshot["taken_at"])
+    if cached:
+        return cached
+    attachments = snapshot["reply"]["files"] + snapshot["files"] if snapshot.get("reply") else snapshot["files"]
+    # downloaded now so they're ready (in the transfer cache) when the quote is sent
+    await asyncio.gather(*(attachment_transfer.download(url) for _, url, _, _ in attachments), return_exceptions=True) # failures are reported when sending
+    embeds = format_snapshot(snapshot)
+    cache_quote_render(message_id, snapshot["taken_at"], embeds, attachments)
     return embeds, attachments
 
+async def fetch_quote_snapshot(quot: list, user_id: int = None) -> dict:
+    channel = contore.get_channel(quot[2]) or await contore.fetch_channel(quot[2])
+    snapshot = await snapshot_quote(await channel.fetch_message(quot[3]))
+    if len(quot) > 7:
+        quot[7] = snapshot
+    else:
+        quot.append(snapshot) # quotes from before snapshots existed get one the first time they're viewed
+    if user_id is not None:
+        contore_save("quotes", user_id)
+    return snapshot
+
+def snapshot_is_stale(snapshot: dict) -> bool:
+    return not snapshot.get("deleted") and time.time() - snapshot.get("taken_at", 0) > QUOTE_SNAPSHOT_REFRESH
+
+def mark_deleted(snapshot: dict):
+    # the attachments went with the message, so their urls are dropped instead of being drawn as broken images
+    for message in [snapshot, snapshot.get("reply")]:
+        if message:
+            message["images"] = []
+            message["files"] = []
+    snapshot["deleted"] = True
+    snapshot["taken_at"] = time.time()
+
+def deleted_quote_snapshot(quot: list) -> dict:
+    # for quotes whose message was deleted before they ever got a snapshot, drawn from what the quote itself stored
+    author = contore.get_user(quot[0])
+    snapshot = {
+        "author": author.display_name if author else "Unknown user",
+        "avatar": author.display_avatar.url if author else None,
+        "bot": author.bot if author else False,
+        "content": quot[4],
+        "url": None,
+        "created_at": datetime.strptime(quot[5], "%Y-%m-%d %H:%M:%S.%f").replace(tzinfo=timezone.utc).isoformat(),
+        "edited_at": None,
+        "images": [],
+        "stickers": [],
+        "files": [],
+        "embeds": [],
+        "reply": None
+    }
+    mark_deleted(snapshot)
+    return snapshot
+
+async def fetch_and_render_quote(quot: list, user_id: int = None):
+    snapshot = quot[7] if len(quot) > 7 and quot[7] else None
+    if snapshot is None or snapshot_is_stale(snapshot):
+        # refreshed before drawing, since the urls in an old snapshot have stopped working
+        try:
+            snapshot = await fetch_quote_snapshot(quot, user_id)
+        except NotFound:
+            if snapshot is None:
+                snapshot = deleted_quote_snapshot(quot)
+                quot[7:] = [snapshot]
+            else:
+                mark_deleted(snapshot)
+            if user_id is not None:
+                contore_save("quotes", user_id)
+        except Exception as e:
+            if snapshot is None:
+                raise
+            print(f"Couldn't refresh quote {quot[3]}: {e}") # drawn from the old snapshot, it'll be tried again next time
+    return await render_snapshot(quot[3], snapshot)
+
+async def render_quote(quot: list, user_id: int = None):
+    snapshot = quot[7] if len(quot) > 7 and quot[7] else None
+    cached = cached_quote_render(quot[3], snapshot["taken_at"]) if snapshot and not snapshot_is_stale(snapshot) else None
+    if cached:
+        return cached
+    if quot[3] not in quote_renders: # share the render with anyone else (e.g. prefetching) waiting on the same quote
+        task = asyncio.ensure_future(fetch_and_render_quote(quot, user_id))
+        quote_renders[quot[3]] = task
+        task.add_done_callback(lambda _: quote_renders.pop(quot[3], None))
+    return await asyncio.shield(quote_renders[quot[3]])
+
+async def prefetch_quotes(quotes: list, user_id: int = None):
+    results = await asyncio.gather(*(render_quote(quot, user_id) for quot in quotes), return_exceptions=True)
+    for quot, result in zip(quotes, results):
+        if isinstance(result, Exception):
+            print(f"Couldn't prefetch quote {quot[3]}: {result}")
+
+class QuoteIndex:
+    # sort orders and filter lookups for one user's quotebook, rebuilt whenever the quotebook changes
+    # quotes are [author id, guild id, channel id, message id, content, created at, added at, snapshot]
+    def __init__(self, quotes: list):
+        self.quotes = quotes
+        self.by_created = sorted(range(len(quotes)), key=lambda i: quotes[i][5])
+        self.created_keys = [quotes[i][5] for i in self.by_created] # for bisecting date ranges
+        self.by_author = {} # {author id: {quote position}}
+        self.by_guild = {} # {guild id: {quote position}}
+        for i, quot in enumerate(quotes):
+            self.by_author.setdefault(quot[0], set()).add(i)
+            self.by_guild.setdefault(quot[1], set()).add(i)
+        self.orders = {} # {sort: [quote position]}, computed on first use
+
+    def author_name(self, author_id: int, display: bool) -> str:
+        user = contore.get_user(author_id)
+        if user is not None:
+            return (user.display_name if display else user.name).lower()
+        # not cached, fall back to the name saved with the newest snapshot of their quotes
+        for i in sorted(self.by_author[author_id], key=lambda i: self.quotes[i][6], reverse=True):
+            if len(self.quotes[i]) > 7 and self.quotes[i][7]:
+                return self.quotes[i][7]["author"].lower()
+        return ""
+
+    def order(self, sort: str) -> list:
+        if sort not in self.orders:
+            if sort == "Username (Alphabetical)" or sort == "Display Name (Alphabetical)":
+                names = {author_id: self.author_name(author_id, sort.startswith("Display")) for author_id in self.by_author}
+                key = lambda i: (names[self.quotes[i][0]], self.quotes[i][6])
+            elif sort == "Account ID":
+                key = lambda i: (self.quotes[i][0], self.quotes[i][6])
+            else: # date added
+                key = lambda i: self.quotes[i][6]
+            self.orders[sort] = sorted(range(len(self.quotes)), key=key)
+        return self.orders[sort]
+
+    def created_between(self, start: str = None, end: str = None) -> set:
+        # both days are inclusive, created at keys are "YYYY-MM-DD HH:MM:SS.ffffff" so the end is bisected at the next day
+        lo = bisect_left(self.created_keys, start) if start else 0
+        hi = bisect_left(self.created_keys, (datetime.strptime(end, "%Y-%m-%d") + timedelta(days=1)).strftime("%Y-%m-%d")) if end else len(self.created_keys)
+        return set(self.by_created[lo:hi])
+
+    def matching_authors(self, value: str) -> set:
+        if value.strip("<@!>").isdigit():
+            return self.by_author.get(int(value.strip("<@!>")), set())
+        value = value.lower()
+        return set().union(*(positions for author_id, positions in self.by_author.items() if value in [self.author_name(author_id, False), self.author_name(author_id, True)]))
+
+    def matching_guilds(self, value: str) -> set:
+        if value.isdigit():
+            return self.by_guild.get(int(value), set())
+        value = value.lower()
+        return set().union(*(positions for guild_id, positions in self.by_guild.items() if contore.get_guild(guild_id) and contore.get_guild(guild_id).name.lower() == value))
+
+    def view(self, sort: str, order: str, filter_type: str = None, filter: str = None) -> list:
+        # raises ValueError for dates that aren't YYYY-MM-DD
+        if filter_type and filter:
+            if filter_type == "Before Date":
+                selected = self.created_between(end=datetime.strptime(filter, "%Y-%m-%d").strftime("%Y-%m-%d"))
+            elif filter_type == "After Date":
+                selected = self.created_between(start=datetime.strptime(filter, "%Y-%m-%d").strftime("%Y-%m-%d"))
+            elif filter_type == "From User":
+                selected = self.matching_authors(filter)
+            else:
+                selected = self.matching_guilds(filter)
+            positions = [i for i in self.order(sort) if i in selected]
+        else:
+            positions = self.order(sort)
+        if order == "Descending":
+            positions = positions[::-1]
+        return [self.quotes[i] for i in positions]
+
+quote_indexes = {} # {user id: QuoteIndex}
+
+def get_quote_index(user_id: int) -> QuoteIndex:
+    if user_id not in quote_indexes:
+        quote_indexes[user_id] = QuoteIndex(data["quotes"].get(user_id, []))
+    return quote_indexes[user_id]
+
 class QuotePageMessage(View):
-    def __init__(self, quotes: list[list[Union[str, int]]], embeds: list[tuple[list[Embed], list[Attachment]]], user_id: int, index: int = 0, timeout: float = None):
+    def __init__(self, quotes: list[list[Union[str, int]]], user_id: int, index: int = 0, timeout: float = None):
         super().__init__(timeout=timeout)
         self.quotes = quotes
-        self.embeds = embeds
         self.user_id = user_id
         self.current_page = index
+        self.prefetch_task = None
         
         self.all_left_button = Button(label="❮❮", style=ButtonStyle.gray, disabled=index == 0)
         self.left_button = Button(label="❮", style=ButtonStyle.gray, disabled=index == 0)
         self.idx = Button(label=str(index + 1), style=ButtonStyle.gray, disabled=True)
-        self.right_button = Button(label="❯", style=ButtonStyle.gray, disabled=len(self.embeds) < 2 or index >= len(self.embeds) - 1 or index == -1)
-        self.all_right_button = Button(label="❯❯", style=ButtonStyle.gray, disabled=len(self.embeds) < 2 or index >= len(self.embeds) - 1 or index == -1)
+        self.right_button = Button(label="❯", style=ButtonStyle.gray, disabled=len(self.quotes) < 2 or index >= len(self.quotes) - 1 or index == -1)
+        self.all_right_button = Button(label="❯❯", style=ButtonStyle.gray, disabled=len(self.quotes) < 2 or index >= len(self.quotes) - 1 or index == -1)
         self.remove_quote_button = Button(label="X", style=ButtonStyle.red)
         self.all_left_button.callback = self.all_left
         self.left_button.callback = self.left
@@ -2867,16 +4426,21 @@ class QuotePageMessage(View):
         self.add_item(self.all_right_button)
         self.add_item(self.remove_quote_button)
 
+    def prefetch(self):
+        # render the surrounding pages in the background so paging doesn't have to wait on discord
+        if self.prefetch_task and not self.prefetch_task.done():
+            self.prefetch_task.cancel()
+        nearby = sorted((i for i in range(self.current_page - QUOTE_PREFETCH, self.current_page + QUOTE_PREFETCH + 1) if 0 <= i < len(self.quotes) and i != self.current_page), key=lambda i: abs(i - self.current_page))
+        self.prefetch_task = asyncio.create_task(prefetch_quotes([self.quotes[i] for i in nearby], self.user_id))
+
     async def update_buttons(self, ctx: Interaction):
-        self.all_right_button.disabled = self.right_button.disabled = self.current_page >= len(self.embeds) - 1
+        self.all_right_button.disabled = self.right_button.disabled = self.current_page >= len(self.quotes) - 1
         self.all_left_button.disabled = self.left_button.disabled = self.current_page - 1 < 0
         self.idx.label = str(self.current_page + 1)
         await ctx.response.defer()
-        if self.embeds[self.current_page] is None:
-            quot = self.quotes[self.current_page]
-            channel = contore.get_channel(quot[2]) or await contore.fetch_channel(quot[2])
-            self.embeds[self.current_page] = await format_message_into_embed(await channel.fetch_message(quot[3]))
-        await ctx.edit_original_response(embeds=self.embeds[self.current_page][0], attachments=self.embeds[self.current_page][1], view=self)
+        embeds, attachments = await render_quote(self.quotes[self.current_page], self.user_id)
+        await ctx.edit_original_response(embeds=embeds, attachments=await attachment_transfer.download_files(attachments), view=self)
+        self.prefetch()
     
     async def all_left(self, ctx: Interaction):
         self.current_page = 0
@@ -2890,23 +4454,31 @@ class QuotePageMessage(View):
             await ctx.response.defer()
 
     async def right(self, ctx: Interaction):
-        if self.current_page < len(self.embeds) - 1:
+        if self.current_page < len(self.quotes) - 1:
             self.current_page += 1
             await self.update_buttons(ctx)
         else:
             await ctx.response.defer()
     
     async def all_right(self, ctx: Interaction):
-        self.current_page = len(self.embeds) - 1
+        self.current_page = len(self.quotes) - 1
         await self.update_buttons(ctx)
     
     async def remove_quote(self, ctx: Interaction):
         if ctx.user.id == self.user_id:
-            self.quotes.pop(self.current_page)
-            self.embeds.pop(self.current_page)
-            data["quotes"][self.user_id].pop(self.current_page)
-            contore_save()
-            self.current_page -= 1
+            removed = self.quotes.pop(self.current_page)
+            # the view may be sorted/filtered, so find the quote itself rather than going by position
+            quotebook = data["quotes"][self.user_id]
+            for i, quot in enumerate(quotebook):
+                if quot is removed:
+                    del quotebook[i]
+                    break
+            quote_indexes.pop(self.user_id, None)
+            contore_save("quotes", self.user_id)
+            if not self.quotes:
+                await ctx.response.edit_message(content="There are no quotes left to view.", embeds=[], attachments=[], view=None)
+                return
+            self.current_page = max(self.current_page - 1, 0)
             await self.update_buttons(ctx)
         else:
             await ctx.response.send_message(f"You can't remove quotes from <@{self.user_id}>'s quotebook.", ephemeral=True)
@@ -2920,7 +4492,7 @@ class QuotePageMessage(View):
                        order = "The direction to sort in",
                        public = "Should the message be ephemeral (only visible to you)?",
                        filter_type = "How should the quotes be filtered",
-                       filter = "The value for the filter",
+                       filter = "The value for the filter, dates (YYYY-MM-DD) include that day",
                        index = "The index of the quote to start on")
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
 async def quotes_view(ctx: Interaction, sort: Literal["Date Added", "Username (Alphabetical)", "Display Name (Alphabetical)", "Account ID"] = "Date Added", order: Literal["Descending", "Ascending"] = "Ascending", public: bool = False, filter_type: Literal["Before Date", "After Date", "From User", "From Server"] = None, filter: str = None, index: int = 1):
@@ -2930,24 +4502,33 @@ async def quotes_view(ctx: Interaction, sort: Literal["Date Added", "Username (A
     if index < 1:
         await ctx.response.send_message("Cannot use indices less than 1.", ephemeral=True)
         return
-    quotes = data["quotes"][ctx.user.id]
-    embeds = [None for _ in quotes]
-    quot = quotes[index-1]
-    embeds[index-1] = await format_message_into_embed(await (contore.get_channel(quot[2]) or await contore.fetch_channel(quot[2])).fetch_message(quot[3]))
-    if order == "Descending":
-        quotes.reverse()
-        embeds.reverse()
-    await ctx.response.send_message(embeds=embeds[index-1][0], files=embeds[index-1][1], view=QuotePageMessage(quotes, embeds, ctx.user.id, index-1), ephemeral=not public)
+    try:
+        quotes = get_quote_index(ctx.user.id).view(sort, order, filter_type, filter)
+    except ValueError:
+        await ctx.response.send_message("Dates must be in the format YYYY-MM-DD.", ephemeral=True)
+        return
+    if not quotes:
+        await ctx.response.send_message("None of your quotes match that filter.", ephemeral=True)
+        return
+    if index > len(quotes):
+        await ctx.response.send_message(f"There are only {len(quotes)} quotes to view.", ephemeral=True)
+        return
+    embeds, attachments = await render_quote(quotes[index-1], ctx.user.id)
+    view = QuotePageMessage(quotes, ctx.user.id, index-1)
+    await ctx.response.send_message(embeds=embeds, files=await attachment_transfer.download_files(attachments), view=view, ephemeral=not public)
+    view.prefetch()
 
 @ctree.context_menu(name="Quote")
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
 async def quote(ctx: Interaction, msg: Message):
-    embeds, attachments = await format_message_into_embed(msg)
-    await ctx.response.send_message(f"Added {msg.author.mention}'s message to your quotes.", embeds=embeds, files=attachments, ephemeral=True)
+    snapshot = await snapshot_quote(msg)
+    embeds, attachments = await render_snapshot(msg.id, snapshot)
+    await ctx.response.send_message(f"Added {msg.author.mention}'s message to your quotes.", embeds=embeds, files=await attachment_transfer.download_files(attachments), ephemeral=True)
     if ctx.user.id not in data["quotes"]:
         data["quotes"][ctx.user.id] = []
-    data["quotes"][ctx.user.id].append([msg.author.id, msg.guild.id, msg.channel.id, msg.id, msg.system_content, msg.created_at.strftime("%Y-%m-%d %H:%M:%S.%f"), datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f")])
-    contore_save()
+    data["quotes"][ctx.user.id].append([msg.author.id, msg.guild.id if msg.guild else None, msg.channel.id, msg.id, msg.system_content, msg.created_at.strftime("%Y-%m-%d %H:%M:%S.%f"), datetime.now().strftime("%Y-%m-%d %H:%M:%S.%f"), snapshot])
+    quote_indexes.pop(ctx.user.id, None)
+    contore_save("quotes", ctx.user.id)
 
 def exp_falloff_choice(options, falloff_rate=2):
     weights = [1 / (falloff_rate ** i) for i in range(len(options))]
@@ -2955,11 +4536,84 @@ def exp_falloff_choice(options, falloff_rate=2):
     normalized_weights = [w / total for w in weights]
     return random.choices(options, weights=normalized_weights, k=1)[0]
 
+SENTIMENT_BATCH_SIZE = 16
+SENTIMENT_BATCH_WAIT = 0.05 # seconds to wait for more requests before running a batch
+SENTIMENT_CACHE_SIZE = 1024
+SENTIMENT_TIMEOUT = 180 # seconds, generous since the first request may have to wait for the model to load
+
+def get_classifier():
+    global classifier
+    with classifier_lock:
+        if classifier is None:
+            started = time.perf_counter()
+            from sentiment_analysis import load_classifier
+            backend = contore_config.get("sentiment_backend", "pytorch") # "quantized" or "onnx" are faster on CPU only machines
+            classifier = load_classifier(backend, top_k=None)
+            print(f"Loaded sentiment classifier ({backend}) in {time.perf_counter() - started:.2f}s")
+    return classifier
+
+def run_classifier(texts: list) -> list:
+    return get_classifier()(texts, batch_size=len(texts), **tokenizer_kwargs)
+
+sentiment_queue = asyncio.Queue() # (content hash, content, future)
+sentiment_cache = OrderedDict() # {content hash: scores}, least recently used first
+sentiment_task = None
+
+async def classify_sentiment(content: str) -> list:
+    # scores for every emotion; the model runs in a worker thread on batches of concurrent requests
+    global sentiment_task
+    key = hashlib.sha256(content.encode()).hexdigest()
+    if key in sentiment_cache:
+        sentiment_cache.move_to_end(key)
+        return sentiment_cache[key]
+    if sentiment_task is None or sentiment_task.done(): # (re)start the service if it isn't running
+        sentiment_task = asyncio.get_running_loop().create_task(run_sentiment_service())
+        sentiment_task.add_done_callback(sentiment_service_stopped)
+    future = asyncio.get_running_loop().create_future()
+    sentiment_queue.put_nowait((key, content, future))
+    return await asyncio.wait_for(future, SENTIMENT_TIMEOUT)
+
+def sentiment_service_stopped(task: asyncio.Task):
+    # nobody is left to answer the queued requests, so fail them instead of leaving them waiting
+    if task is not sentiment_task: # a new service has already been started and will answer them
+        return
+    error = RuntimeError("The sentiment service stopped" if task.cancelled() else f"The sentiment service stopped: {task.exception()}")
+    while not sentiment_queue.empty():
+        _, _, future = sentiment_queue.get_nowait()
+        if not future.done():
+            future.set_exception(error)
+
+async def run_sentiment_service():
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await sentiment_queue.get()]
+        deadline = loop.time() + SENTIMENT_BATCH_WAIT
+        while len(batch) < SENTIMENT_BATCH_SIZE:
+            try:
+                batch.append(await asyncio.wait_for(sentiment_queue.get(), max(deadline - loop.time(), 0)))
+            except asyncio.TimeoutError:
+                break
+        try:
+            texts = {key: content for key, content, _ in batch} # identical messages only need to be classified once
+            results = await asyncio.to_thread(run_classifier, list(texts.values()))
+            results = dict(zip(texts, results))
+            for key, result in results.items():
+                sentiment_cache[key] = result
+                if len(sentiment_cache) > SENTIMENT_CACHE_SIZE:
+                    sentiment_cache.popitem(last=False)
+            for key, _, future in batch:
+                if not future.done():
+                    future.set_result(results[key])
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+
 @ctree.context_menu(name="Sentiment Analysis")
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
 async def sentiment_evaluator(ctx: Interaction, msg: Message):
     await ctx.response.defer()
-    result = classifier(msg.system_content, **tokenizer_kwargs)[0]
+    result = await classify_sentiment(msg.system_content)
     await ctx.followup.send(f"`{exp_falloff_choice(sorted(result, key=lambda x: x['score']))['label'].capitalize()}` ({(result[0]['score'] + random.uniform(-0.05, 0.05)) * 100:.2f}%)")
 
 async def change_status_periodically(client: Client, statuses: list, status_update: list):
@@ -2989,14 +4643,27 @@ async def on_guild_join(guild: Guild):
     if guild.id not in data["achievements"]:
         data["achievements"][guild.id] = { }
     if guild.id not in data["achievement_defs"]:
-        data["achievement_defs"][guild.id] = { }
+        data["achievement_defs"][guild.id] = [ ]
     if guild.id not in data["achievement_progress"]:
         data["achievement_progress"][guild.id] = { }
-    contore_save()
+    for section in ["auto_roles", "roles_on_messages", "autoreactions", "scheduled_roles", "leave_msgs", "achievements", "achievement_defs", "achievement_progress"]:
+        contore_save(section, guild.id)
 
 @contore.event
 async def on_ready():
-    check_scheduled_roles.start()
+    if "login" not in startup_times:
+        startup_times["login"] = time.perf_counter() - login_started
+        print("Startup: " + ", ".join(f"{phase} {seconds:.2f}s" for phase, seconds in startup_times.items()) + f" (total {time.perf_counter() - startup_started:.2f}s)")
+        asyncio.get_running_loop().run_in_executor(None, get_classifier) # warm up without holding up anything else
+    if not flush_data.is_running():
+        flush_data.start()
+    if not reconcile_achievement_stats.is_running():
+        reconcile_achievement_stats.start()
+    start_scheduler()
+    start_role_workers()
+    reconcile_voice_sessions()
+    if not credit_voice_sessions.is_running():
+        credit_voice_sessions.start()
     ctree.add_command(auto_commands)
     ctree.add_command(message_commands)
     ctree.add_command(reset_commands)
@@ -3029,12 +4696,23 @@ def convert_keys_to_ints(d):
     else:
         return d
 
+if "--benchmark-autoreactions" in sys.argv:
+    arguments = sys.argv[sys.argv.index("--benchmark-autoreactions") + 1:]
+    benchmark_autoreactions(int(arguments[0]) if arguments else 1000)
+    sys.exit()
+
+data_load_started = time.perf_counter()
 with open("data/config.ccfg", "r") as f:
     contore_config = json.load(f)
-with open("data/data.cont", "r") as f:
-    jdata = convert_keys_to_ints(json.load(f, object_hook=decode_sets)) # ints are more performant
-    for key, value in jdata.items():
-        data[key] = value
-    del jdata
-
+attachment_transfer.max_bytes = contore_config.get("attachment_max_bytes", attachment_transfer.max_bytes)
+storage = SqliteStorage() if contore_config.get("storage", "json") == "sqlite" else JsonStorage()
+for key, value in storage.load().items():
+    data[key] = value
+dirty_data.clear()
+pending_saves = 0
+progress_counters.replay()
+atexit.register(contore_flush_sync)
+startup_times["data load"] = time.perf_counter() - data_load_started
+
+login_started = time.perf_counter()
 contore.run("DISCORD_BOT_TOKEN")
\ No newline at end of file
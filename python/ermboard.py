@@ -9,8 +9,7 @@ from os.path import exists
 from json import load
 import re
 from emoji import emoji_list
-from io import BytesIO
-from httpx import AsyncClient
+from attachment_transfer import attachment_entry, download_files, is_image, close as close_transfers
 from sys import exit as sexit, platform
 from subprocess import Popen
 import sqlite3
@@ -24,7 +23,10 @@ class Client(discord.Client):
     def __init__(self, *, intents: discord.Intents, **options):
         super().__init__(intents=intents, options=options)
         self.tree = app_commands.CommandTree(self)
-        self.attachment_retriever = AsyncClient()
+
+    async def close(self):
+        await super().close()
+        await close_transfers()
 
     async def on_ready(self):
         print(f"Logged in as {self.user.display_name}")
@@ -288,15 +290,15 @@ async def on_raw_message_edit(payload: discord.RawMessageUpdateEvent):
             delete_ermboard_message(message.id, message.channel.id)
             return
         embeds, _ = await format_erm_embed(message, colour=discord.Colour(0xEEE2A0))
-        attachments = await copy_attachments(message)
+        files = attachment_entries(message)
 
         if message.reference:
             ref_message = await message.channel.fetch_message(message.reference.message_id)
             ref_embeds, _ = await format_erm_embed(ref_message, prefix="Replying to ")
             embeds.extend(ref_embeds)
             #filenames.extend(ref_filenames)
-            attachments.extend(await copy_attachments(ref_message))
-        await ermboard_message.edit(embeds=embeds, attachments=attachments)
+            files.extend(attachment_entries(ref_message))
+        await ermboard_message.edit(embeds=embeds, attachments=await download_files(files))
 
 async def count_erms(settings: GuildSettings, *messages: discord.Message):
     l: list[discord.Reaction] = []
@@ -386,7 +388,7 @@ async def format_erm_embed(message: discord.Message, prefix="", colour=discord.C
     embed.set_author(name=f"{prefix}{message.author.display_name}{' 🤖' if message.author.bot or message.author.system else ''}", url=message.jump_url, icon_url=message.author.display_avatar.url)
     if message.attachments:
         for attachment in message.attachments:
-            if attachment.content_type.startswith('image/'):
+            if is_image(attachment):
                 if getattr(embed, "_image", None) is None:
                     embed.set_image(url=attachment.url)
                 else:
@@ -404,18 +406,9 @@ async def format_erm_embed(message: discord.Message, prefix="", colour=discord.C
     embeds.extend(message.embeds)
     return embeds, filenames
 
-async def copy_attachments(message: discord.Message):
-    attachments = []
-    if message.attachments:
-        for attachment in message.attachments:
-            if not attachment.content_type.startswith('image/'):
-                async with client.attachment_retriever as h:
-                    response = await h.get(attachment.url)
-                    if response.status_code == 200:
-                        attachment_bytes = response.read()
-                        file = discord.File(BytesIO(attachment_bytes), filename=attachment.filename, spoiler=attachment.is_spoiler(), description=attachment.description)
-                        attachments.append(file)
-    return attachments
+def attachment_entries(message: discord.Message):
+    # images are already shown in the embeds, everything else gets downloaded and reuploaded
+    return [attachment_entry(attachment) for attachment in message.attachments if not is_image(attachment)]
 
 async def send_to_ermboard(message: discord.Message, settings: GuildSettings, erm_count: int = None):
     ermboard_channel = client.get_channel(settings.ermboard_channel_id) or await client.fetch_channel(settings.ermboard_channel_id)
@@ -423,7 +416,7 @@ async def send_to_ermboard(message: discord.Message, settings: GuildSettings, er
         return
 
     embeds, _ = await format_erm_embed(message, colour=discord.Colour(0xEEE2A0))
-    attachments = await copy_attachments(message)
+    files = attachment_entries(message)
 
     if message.reference:
         try:
@@ -431,9 +424,10 @@ async def send_to_ermboard(message: discord.Message, settings: GuildSettings, er
             ref_embeds, _ = await format_erm_embed(ref_message, prefix="Replying to ")
             embeds.extend(ref_embeds)
             #filenames.extend(ref_filenames)
-            attachments.extend(await copy_attachments(ref_message))
+            files.extend(attachment_entries(ref_message))
         except discord.NotFound:
             pass
+    attachments = await download_files(files)
 
     erm_count = erm_count or await count_erms(settings, message)
     additional_text = f"{DEFAULT_ERM} **{erm_count}** | {message.jump_url}"
@@ -1,22 +1,209 @@
 # Tiny sentiment analysis script using a pre-trained model from Hugging Face
 
-from os import environ
+from os import environ, makedirs, replace
 environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+from argparse import ArgumentParser
+from itertools import islice
+from json import dumps, load, loads
+from os.path import isfile, join
+from shutil import rmtree
+from statistics import median
+from sys import stdin, stdout, stderr
+from tempfile import mkdtemp
+from time import perf_counter
 from transformers import pipeline
 
-classifier = pipeline("sentiment-analysis", model="bhadresh-savani/bert-base-go-emotion")
+MODEL = "bhadresh-savani/bert-base-go-emotion"
+BACKENDS = ["pytorch", "quantized", "onnx"]
+CACHE_FOLDER = environ.get("SENTIMENT_CACHE", "data/sentiment")
+ONNX_FOLDER = join(CACHE_FOLDER, MODEL.replace("/", "--") + "-onnx") # the exported model
+
+backend = environ.get("SENTIMENT_BACKEND", "pytorch")
+classifier = None
 tokenizer_kwargs = {'padding': True, 'truncation': True, 'max_length': 128}
 
+def load_classifier(backend: str = "pytorch", **kwargs):
+    # pytorch: the reference full precision model
+    # quantized: the same model with its linear layers dynamically quantized to int8 (CPU only)
+    # onnx: the model exported to ONNX and run with ONNX Runtime (needs optimum[onnxruntime])
+    if backend == "pytorch":
+        return pipeline("sentiment-analysis", model=MODEL, **kwargs)
+    from transformers import AutoTokenizer
+    tokenizer = AutoTokenizer.from_pretrained(MODEL)
+    if backend == "quantized":
+        from torch import qint8
+        from torch.nn import Linear
+        from torch.quantization import quantize_dynamic
+        from transformers import AutoModelForSequenceClassification
+        model = quantize_dynamic(AutoModelForSequenceClassification.from_pretrained(MODEL), {Linear}, dtype=qint8)
+    elif backend == "onnx":
+        from optimum.onnxruntime import ORTModelForSequenceClassification
+        if not isfile(join(ONNX_FOLDER, "model.onnx")):
+            # exporting is slower than just loading the pytorch model, so it's only done once
+            makedirs(CACHE_FOLDER, exist_ok=True)
+            export_folder = mkdtemp(dir=CACHE_FOLDER)
+            try:
+                ORTModelForSequenceClassification.from_pretrained(MODEL, export=True).save_pretrained(export_folder)
+                rmtree(ONNX_FOLDER, ignore_errors=True) # a leftover without model.onnx
+                replace(export_folder, ONNX_FOLDER)
+            except BaseException:
+                rmtree(export_folder, ignore_errors=True)
+                raise
+        model = ORTModelForSequenceClassification.from_pretrained(ONNX_FOLDER)
+    else:
+        raise ValueError(f"Unknown sentiment backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    return pipeline("sentiment-analysis", model=model, tokenizer=tokenizer, **kwargs)
+
+def get_classifier():
+    global classifier
+    if classifier is None:
+        classifier = load_classifier(backend)
+    return classifier
+
 def analyze_emotion(text):
-    result = classifier(text, **tokenizer_kwargs)[0]
+    result = get_classifier()(text, **tokenizer_kwargs)[0]
 
     return {
         'emotion': result['label'],
         'confidence': round(result['score'] * 100, 2)
     }
 
+BENCHMARK_TEXTS = [
+    "I can't believe you actually remembered my birthday, thank you so much!",
+    "This is the third time the build broke today.",
+    "ok",
+    "I'm not sure how I feel about the new update, it's kind of confusing.",
+    "Why would anyone think that was a good idea??",
+    "I miss the old server, everyone was so much nicer back then.",
+    "LMAO that's the funniest thing I've seen all week",
+    "Please stop pinging me.",
+    "I'm really nervous about my exam tomorrow, I haven't studied nearly enough and I don't know what to do.",
+    "Wow. Just wow.",
+]
+
+def benchmark(backends: list, texts: list, batch_size: int = 32, runs: int = 3):
+    reference = None
+    for name in backends:
+        started = perf_counter()
+        model = load_classifier(name)
+        load_time = perf_counter() - started
+        model(texts[:1], **tokenizer_kwargs) # warm up
+
+        latencies = []
+        for text in texts[:50]:
+            started = perf_counter()
+            model(text, **tokenizer_kwargs)
+            latencies.append(perf_counter() - started)
+
+        throughput = 0
+        for _ in range(runs):
+            started = perf_counter()
+            labels = [result['label'] for result in model(texts, batch_size=batch_size, **tokenizer_kwargs)]
+            throughput = max(throughput, len(texts) / (perf_counter() - started))
+
+        if reference is None:
+            reference = labels
+        agreement = sum(a == b for a, b in zip(labels, reference)) / len(labels) * 100
+        print(f"{name:>9}: load {load_time:6.2f}s, latency {median(latencies) * 1000:7.2f}ms (median), throughput {throughput:7.1f} texts/s (batch {batch_size}), top label agreement with {backends[0]} {agreement:.1f}%")
+
+def message_text(record: dict) -> str:
+    # same as the eternalizer's readable logs, system messages have their content in system_content
+    return record.get("system_content") or record.get("content") or ""
+
+def read_records(stream, format: str):
+    # yields (record, text to classify); blank texts (e.g. attachment only messages) are skipped
+    if format == "auto":
+        first = stream.read(1)
+        while first.isspace():
+            first = stream.read(1)
+        format = "json" if first == "[" else "jsonl" if first == "{" else "text"
+        stream = PeekedStream(first, stream)
+    if format == "json":
+        records = load(stream) # an eternalizer channel export is a single JSON array
+    elif format == "jsonl":
+        records = (loads(line) for line in stream if line.strip())
+    else:
+        records = ({"text": line.rstrip("\n")} for line in stream)
+    for record in records:
+        text = record["text"] if format == "text" else message_text(record)
+        if text.strip():
+            yield record, text
+
+class PeekedStream:
+    # puts back the character read while sniffing the format of a stream that can't seek (stdin)
+    def __init__(self, first: str, stream):
+        self.first = first
+        self.stream = stream
+
+    def read(self, size: int = -1) -> str:
+        first, self.first = self.first, ""
+        return first + self.stream.read(size)
+
+    def __iter__(self):
+        first, self.first = self.first, ""
+        for line in self.stream:
+            yield first + line
+            first = ""
+        if first:
+            yield first
+
+def output_record(record: dict, result: dict) -> dict:
+    output = {key: record[key] for key in ("id", "text", "author", "channel", "created_at") if key in record}
+    output["emotion"] = result['label']
+    output["confidence"] = round(result['score'] * 100, 2)
+    return output
+
+def classify_stream(records, output, batch_size: int = 32, chunk_size: int = 1024):
+    model = get_classifier()
+    records = iter(records)
+    processed = 0
+    started = perf_counter()
+    while chunk := list(islice(records, chunk_size)):
+        texts = [text for _, text in chunk]
+        # sort the chunk by token count so each batch is padded to roughly the same length
+        lengths = [len(ids) for ids in model.tokenizer(texts, truncation=True, max_length=tokenizer_kwargs['max_length'])["input_ids"]]
+        order = sorted(range(len(texts)), key=lengths.__getitem__)
+        results = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch = order[start:start + batch_size]
+            for i, result in zip(batch, model([texts[i] for i in batch], batch_size=len(batch), **tokenizer_kwargs)):
+                results[i] = result
+        for (record, _), result in zip(chunk, results):
+            output.write(dumps(output_record(record, result), ensure_ascii=False) + "\n")
+        processed += len(chunk)
+        print(f"Classified {processed} messages ({processed / (perf_counter() - started):.1f}/s)", file=stderr)
+
 if __name__ == "__main__":
-    while True:
-        user_input = input("Enter a message: ")
-        result = analyze_emotion(user_input)
-        print(f"Primary Emotion: {result['emotion']} ({result['confidence']}%)")
\ No newline at end of file
+    parser = ArgumentParser(description="Classify the emotion of messages")
+    parser.add_argument("--backend", choices=BACKENDS, default=backend, help="The inference backend to use")
+    parser.add_argument("--benchmark", nargs="?", const="", metavar="FILE", help="Compare every backend against pytorch, optionally on the lines of FILE")
+    parser.add_argument("input", nargs="?", help="Classify every message in this file (- for stdin) instead of running interactively")
+    parser.add_argument("--format", choices=["auto", "text", "jsonl", "json"], default="auto", help="text: one message per line, jsonl: one message object per line, json: an array of message objects (e.g. an eternalizer export)")
+    parser.add_argument("--output", "-o", help="Where to write the JSONL results (defaults to stdout)")
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--chunk-size", type=int, default=1024, help="How many messages to read and sort by length at a time")
+    args = parser.parse_args()
+    backend = args.backend
+
+    if args.benchmark is not None:
+        if args.benchmark:
+            with open(args.benchmark, "r", encoding="utf-8") as f:
+                texts = [line.strip() for line in f if line.strip()]
+        else:
+            texts = BENCHMARK_TEXTS * 20
+        benchmark(["pytorch"] + [name for name in BACKENDS if name != "pytorch"], texts, args.batch_size)
+    elif args.input is not None:
+        source = stdin if args.input == "-" else open(args.input, "r", encoding="utf-8")
+        output = open(args.output, "w", encoding="utf-8") if args.output else stdout
+        try:
+            classify_stream(read_records(source, args.format), output, args.batch_size, args.chunk_size)
+        finally:
+            if source is not stdin:
+                source.close()
+            if output is not stdout:
+                output.close()
+    else:
+        while True:
+            user_input = input("Enter a message: ")
+            result = analyze_emotion(user_input)
+            print(f"Primary Emotion: {result['emotion']} ({result['confidence']}%)")